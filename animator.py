@@ -1,15 +1,25 @@
-from time import time, sleep
-from time import time, sleep
+from time import time, sleep, perf_counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import asyncio
 # comment out the next line if using the real neopixel library
 import sys, os
-from numpy.random import randint
+import numpy
 try:
     from rpi_ws281x import *
 except:
     sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/rpi-ws281x-simulator')
-    from rpi_ws281x_simulator import *
-from gradients import GradientDesc, gradient_preset, SMOOTH, STEP
+    try:
+        from rpi_ws281x_simulator import *
+    except ImportError: # no cv2, so record the frames instead of drawing them
+        from rpi_ws281x_headless import *
+from gradients import GradientDesc, gradient_preset, SMOOTH, STEP, PAL_SIZE, PAL_BLACK, PAL_SPOT
 from colours import *
+import render_stats
+from correction import ColourCorrection
+from layout import Layout, X_AXIS, Y_AXIS, RADIUS, ANGLE
+from pipeline import PipelinedStrip
 
 # How it works overview:
 # There are LED_COUNT LEDs in the strip.
@@ -27,6 +37,10 @@ from colours import *
 # adjusting the start point of the copy to give the motion effect.
 # Then any overlay effects (sparkle, fade, spot) are applied.
 # Once the pattern is complete it is sent to the LEDs
+# With a layout (layout.py) the segments make up a line of positions along an
+# axis instead, and each LED takes its colour from its position on the line.
+# Segments of different sizes (seg_sizes) work the same way: the line is one
+# segment as long as the biggest and each segment is spread over its own LEDs.
 
 # LED strip configuration passed to WS2812 library:
 LED_PIN = 18            # GPIO pin connected to the pixels (18 uses PWM1).
@@ -40,267 +54,1166 @@ LED_CHANNEL = 0         # set to '1' for GPIOs 13, 19, 41, 45 or 53
 STOP = 0; RIGHT=1; LEFT=2; L2R1=3
 # Looping values
 REPEAT=1; REVERSE=2
-#----------------------- neopixel globals
-_pat_strip = None # This is where the WS2812 library stores its stuff
-_max_brightness = None
-_led_count = None
-
-#----------------------- Fade and sparkle stuff
-_fade_blend = None              # square wave or sawtooth
-_fade_min = 0                   # dimmest value
-_fade_max = 100                 # brightest value
-_fade_steps_per_repeat = None           # how long the fade cycle is
-_fade_s_per_repeat = None           # how long the fade cycle is
-_fade_steps_per_half = None         # half a cycle
-_fade_s_per_step = None             # how long each frame in the fade is
-_fade_t_start = 0               # when the cycle began
-
-# Sparkle
-_spark_count = 0                # Number of sparks to add in per step
-_sparkles = None                # vector of random indexes into the led data
-_spark_t_start = 0              # when this pattern of sparles started
-_spark_duration = None          # how long each pattern of sparkles lasts (secs)
-
-def _fade_scale(f_min, f_max):
-    global _fade_min, _fade_max, _fade_steps_per_half, _fade_steps_per_repeat, _fade_s_per_step
-    _fade_min = int(_max_brightness*f_min/100)
-    _fade_max = int(_max_brightness*f_max/100)
-    _fade_steps_per_half = max(0, _fade_max - _fade_min)
-    _fade_steps_per_repeat = _fade_steps_per_half * 2
-    if _fade_steps_per_repeat > 0:
-        _fade_s_per_step = _fade_s_per_repeat / _fade_steps_per_repeat
-    else:
-        _fade_s_per_step = 1
-       # ~ print('DEBUG:animator:65 min=', _fade_min, ' max=', _fade_max, ' steps=',_fade_steps_per_repeat)
-
-def _render_fade_spark(t_now):
-    # First the sparkles - a random set of places to set white for _spark_duration
-    global _sparkles, _spark_t_start
-    if _spark_count > 0:
-        if t_now - _spark_t_start > _spark_duration: # time to get a new set of sparkles
-            _sparkles = randint(0, _leds_in_use, _spark_count)
-            _spark_t_start = t_now
-        data = _pat_strip.getPixels()
-        for i in _sparkles:
-            data[int(i)]=RGB_White
-        t_next = _spark_t_start + _spark_duration
-    else:
-        t_next = t_now + 1000
-        
-    if _fade_steps_per_repeat == 0: # No fading so return
-        return t_next
+# Palette cycling modes
+ROTATE=1; TWEEN=2
+# Render engines
+LISTS=0; NUMPY=1
+BAKE_MAX_BYTES = 8*1024*1024        # biggest frame table bake=True is prepared to build
+SPARK_DECAY_STEPS = 16              # frames over which a decaying spark fades out
+XFADE_STEPS = 64                    # frames a crossfade between patterns is drawn in (at most)
+PALETTE_STEPS = 64                  # steps each way of a TWEEN palette cycle
+# Settings that can be changed while rendering with Animator.queue
+LIVE_UPDATES = ('define_pattern', 'define_spot', 'define_sparkle', 'define_fade', 'set_max_brightness',
+    'set_brightness_layer', 'set_colour_correction', 'define_palette_cycle')
+# Brightness layer scale tables: _SCALE_LUT[alpha*256 + c] is colour byte c at alpha/255
+_SCALE_LUT = ((numpy.arange(256)[:, None] * numpy.arange(256) + 127) // 255).astype(numpy.uint8).ravel()
 
-    global _fade_t_start
-    if _fade_t_start == 0: _fade_t_start = t_now
-    
-    step = (t_now -_fade_t_start) // _fade_s_per_step
-    if step >= _fade_steps_per_repeat:
-        step = 0
-        _fade_t_start = t_now
-        
-    if _fade_blend == STEP:
-        new_b = _fade_min if step < _fade_steps_per_half else _fade_max
-    else:
-        if step < _fade_steps_per_half: # ramping up
-            new_b = _fade_min + step
-        else: # ramping down
-            new_b = _fade_max - (step - _fade_steps_per_half)
-            
-    # Set the new value which mustn't be above the currently set max brightness
-    new_b = int(min(new_b, _max_brightness))
-    if new_b != _pat_strip.getBrightness():
-        _pat_strip.setBrightness(new_b)
-    
-    return _fade_t_start + (step+1) * _fade_s_per_step
-        
-        
-
-#----------------------- Moving spot stuff
-_spot_size = 0                  # Size of moving spot, 0 = off
-_spot_colour = None             # Colour of the moving spot
-_spot_t_start = None            # When current spot animation started
-_spot_s_per_step = None         # Sets the speed of the spot animation
-_spot_steps_per_repeat = None   # Number of steps in spot animation
-_spot_reverse = None            # RepeatLooping type - repeat or reverse
-_spot_motion_now = None         # Direction of spot animation for this loop
-
-def _render_spot(t_now):
-    # Find out which step we're on in the pattern, need to calculate this
-    # as timing is important and we may need to skip steps to keep up
-    if _spot_size == 0:
-        return t_now + 1000
-
-    global _spot_t_start
-    if _spot_t_start == 0: _spot_t_start = t_now
-    
-    global _spot_motion_now
-    step = int((t_now - _spot_t_start) // _spot_s_per_step)
-    if step >= _spot_steps_per_repeat: # Completed run, start again
-        step = 0
-        _spot_t_start = t_now;
-        if _spot_reverse == REVERSE:
-            _spot_motion_now = LEFT if _spot_motion_now == RIGHT else RIGHT
-
-    # Work out the direction we're going
-    if _spot_motion_now == RIGHT: ix = step # Count up
-    else: ix = _pat_seg_size -_spot_size - step # Count down
-    # ~ print('DEBUG:animator: spot step=', step, '/', _spot_steps_per_repeat,' spot ix=', ix)
-
-    # Paint the spot in its current position
-    # ~ print('DEBUG:animator: ix=', ix, ' _spot_size=', _spot_size)
-    _pat_strip.getPixels()[ix:ix+_spot_size]=[_spot_colour]*_spot_size
-            
-    return _spot_t_start + _spot_s_per_step*(step+1); # Theoretical start time for next step (may be past)
-
-#----------------------- Main pattern
-# Pattern stuff
-_pat_motion_now = RIGHT             # Current direction of pattern motion
-_pat_reverse = REPEAT               # When pattern gets to end, does it repeat or reverse
-_pat_sequential = None              # Do you fill the segments from the whole gradient (True) or have the whole segment filled with the same colour (False)
-# Segment stuff
-_pat_segments = 0                   # How many copies of the gradient to be fitted into the pattern
-_pat_seg_size = 0
-pat_seg_reverse = REPEAT            # Each segment is repeat or reverse of previous one
-# Where are we in the animation
-_pat_t_start = 0
-_pat_s_per_step = 0
-# Gradient object and data
-_gra_desc = None
-_gra_data = None # maximum size a segment can be
-_leds_in_use = None # how many are actually being used
-
-# Definition for the L2R1 motion - how far right and then left to go.
-# These vary according to the segment size
-_l2r1_l = 0
-_l2r1_r = 0
-_l2r1_t = 0
-_l2r1_d = 0
-def _set_l2r1_globals():
-    global _l2r1_l, _l2r1_r, _l2r1_t, _l2r1_d
-    _l2r1_l = max(2, _pat_seg_size//5)
-    _l2r1_r = max(1, _l2r1_l//3)
-    _l2r1_t = _l2r1_l + _l2r1_r
-    _l2r1_d = _l2r1_l - _l2r1_r
-    # ~ print('DEBUG:animator: r=',_l2r1_r,' l=',_l2r1_l,' ss//t*t=',_pat_seg_size//_l2r1_t*_l2r1_t)
-
-def _render_segment(t_now):
-    # Find out which step we're on in the pattern, need to calculate this as timing is 
-    # important and we may need to skip steps to keep up
-    
-    # _pat_t_start is set to 0 by anim_define_pattern to indicate 'start again'
-    global _pat_t_start
-    if _pat_t_start == 0:
-        _pat_t_start = t_now
-    
-    global _pat_s_per_step, _pat_steps_per_repeat
-    global _pat_motion_0, _pat_motion_now, _pat_reverse
-    # ~ print("DEBUG:animator: _pat_motion_now=",_pat_motion_now)
-    if _pat_motion_now == STOP:
-        step = 0
-    else:
-        step = int(((t_now - _pat_t_start) / _pat_s_per_step) + 0.5)
-        if step >= _pat_steps_per_repeat: # completed pattern, start again
-            step = 0;
-            if _pat_motion_now != L2R1: 
-                if _pat_reverse == REVERSE: 
-                    _pat_motion_now = RIGHT if _pat_motion_now == LEFT else LEFT 
-            _pat_t_start = t_now
-    # Calculate start point for copying entries from the pattern palette (pat_ix)
-    # Use the step number and the direction of motion
-    # Work out the direction we're going
-    if _pat_motion_now == LEFT or _pat_motion_now == STOP:
-        pat_ix = step # Count up
-    elif _pat_motion_now == RIGHT:
-        pat_ix = _pat_seg_size-1 - step # Count down
-    elif _pat_motion_now == L2R1:
-        # This is the complicated one: turns out this does the trick! T=total(L,R), D=difference(L,R)
-        rem = step % _l2r1_t
-        pat_ix = (step // _l2r1_t) * _l2r1_d + (rem if rem <= _l2r1_l else _l2r1_l - (rem - _l2r1_l))
-        pat_ix = pat_ix % _pat_seg_size # cope with wrap around
-
-    # ~ print('DEBUG:animator: step=',step, 'LEFT' if _pat_motion_now==LEFT else 'RIGHT' if _pat_motion_now==RIGHT else 'L2R1', "pat_seg=", _pat_seg_size, " pat_ix=", pat_ix)
-    if _pat_sequential: # copy the gradient into the segment, offset by the pat_ix
-        _pat_strip.getPixels()[0:_pat_seg_size]=_gra_data[pat_ix:_pat_seg_size]+_gra_data[:pat_ix]
-    else: # non-sequential means the whole segment is the same colour
-        _pat_strip.getPixels()[0:_pat_seg_size]=[_gra_data[pat_ix]]*_pat_seg_size
-    
-    if _pat_motion_now == STOP:
-        return t_now + 10 # no need but it seems nice to refresh every now and again!
-    else:
-        return _pat_t_start + _pat_s_per_step*(step+1); # Theoretical start time for next step (may be past)
-    
-def _render_frame():
+def _mix(under, over, alpha):
     """
-    Call all the renderers to build up the current state and then show on the LED strip
-    Return the time of the next frame
+    Mix colour over into colour under, alpha out of 256. Works on plain ints
+    and on uint32 arrays alike: two channels at a time, 16 bits apart so
+    the products can't run into each other.
     """
-    
-    t_now = time() # Use the same time throughout the calculations
+    lo = (((under & 0x00FF00FF) * (256 - alpha) + (over & 0x00FF00FF) * alpha) >> 8) & 0x00FF00FF
+    hi = (((under >> 8) & 0x00FF00FF) * (256 - alpha) + ((over >> 8) & 0x00FF00FF) * alpha) & 0xFF00FF00
+    return lo | hi
 
-    # Handle blanking
-    if (_max_brightness == 0):
-        _pat_strip.show()
-        return t_now + 1
+def segment_sizes(led_count, segments):
+    """
+    Sizes for define_pattern(..., seg_sizes=) splitting led_count LEDs into
+    segments as evenly as possible, with no LEDs left over
+    """
+    return [led_count * (i+1) // segments - led_count * i // segments for i in range(segments)]
+
+def _segment_map(seg_sizes, line_size, seg_reverse):
+    """
+    Position on the line for every LED of segments of seg_sizes, each one
+    the whole line spread over its LEDs (odd ones backwards for REVERSE)
+    """
+    maps = []
+    for i, size in enumerate(seg_sizes):
+        pos = numpy.arange(size) * line_size // size
+        maps.append(pos[::-1] if seg_reverse == REVERSE and i % 2 else pos)
+    return numpy.concatenate(maps)
+
+class _NoStrip:
+    """
+    Strip for an Animator that only composes patterns (the incoming pattern
+    of a crossfade), never sent anywhere
+    """
+    def begin(self): pass
+    def setBrightness(self, brightness): pass
+
+# Everything define_pattern sets up, handed over from the incoming pattern
+# when a crossfade finishes
+_PATTERN_STATE = ('_pat_motion_now', '_pat_reverse', '_pat_sequential', '_pat_segments', '_pat_seg_size',
+    '_pat_seg_reverse', '_pat_t_start', '_pat_s_per_step', '_pat_steps_per_repeat', '_pat_ix_now',
+    '_gra_desc', '_gra_data', '_gra_arr', '_leds_in_use', '_l2r1_l', '_l2r1_r', '_l2r1_t', '_l2r1_d',
+    '_pat_ix_tables', '_baked_frames', '_pat_frame', '_palette', '_pat_line', '_lay_map')
+
+_prepare_pool = None # thread that sets up incoming patterns, started when first needed
+
+class Animator:
+    """
+    Everything needed to animate one LED strip: the strip itself, the
+    pattern, spot, sparkle and fade settings and where each of them has
+    got to. Create one per strip (e.g. one per PWM channel) to drive
+    several strips from one process; the anim_* functions below work on
+    a single default Animator set up by anim_init.
+    """
+    __slots__ = (
+        # neopixel stuff
+        '_pat_strip', '_max_brightness', '_led_count', '_time', '_sleep', '_stats', '_stats_dump_path',
+        # NumPy engine buffers
+        '_engine', '_frame', '_frame_out', '_frame_segs', '_gra_arr', '_pat_frame', '_palette', '_pat_line',
+        # Brightness layer and colour correction
+        '_alpha', '_alpha_base', '_correction', '_lit', '_lit_out', '_lit_bytes', '_frame_bytes', '_lut_ix',
+        # Fade
+        '_fade_blend', '_fade_min', '_fade_max', '_fade_steps_per_repeat', '_fade_s_per_repeat',
+        '_fade_steps_per_half', '_fade_s_per_step', '_fade_t_start',
+        '_fade_layer', '_fade_first', '_fade_levels', '_fade_offsets', '_fade_ix', '_fade_lut_ix', '_fade_step_now',
+        # Sparkle
+        '_spark_count', '_sparkles', '_spark_t_start', '_spark_duration',
+        '_spark_rng', '_spark_rand', '_spark_palette', '_spark_pal_ix', '_spark_colours',
+        '_spark_decay', '_spark_born', '_spark_age', '_spark_due',
+        # Moving spot
+        '_spot_size', '_spot_colour', '_spot_t_start', '_spot_s_per_step', '_spot_steps_per_repeat',
+        '_spot_reverse', '_spot_motion_now', '_spot_ix_now', '_spot_def',
+        # Main pattern
+        '_pat_motion_now', '_pat_reverse', '_pat_sequential', '_pat_segments', '_pat_seg_size',
+        '_pat_seg_reverse', '_pat_t_start', '_pat_s_per_step', '_pat_steps_per_repeat', '_pat_ix_now',
+        '_gra_desc', '_gra_data', '_leds_in_use', '_seg_list', '_lay_map',
+        '_l2r1_l', '_l2r1_r', '_l2r1_t', '_l2r1_d',
+        # Baked frame tables
+        '_pat_ix_tables', '_baked_frames',
+        # Crossfade
+        '_xfade_next', '_xfade_ready', '_xfade_s', '_xfade_t_start',
+        # Change tracking
+        '_track_changes', '_keepalive_s', '_changed', '_last_sent', '_t_last_sent',
+        # Live updates
+        '_pending', '_wake',
+        # Palette cycling
+        '_pcyc_mode', '_pcyc_steps', '_pcyc_s_per_step', '_pcyc_t_start', '_pcyc_step_now',
+        '_pcyc_base', '_pcyc_from', '_pcyc_to', '_pcyc_def',
+    )
+
+    def __init__(self, led_count, engine=LISTS, strip=None, clock_time=time, clock_sleep=sleep, pipelined=False):
+        """
+        Initial set up of the system for animations
+        Clears everything out and switches things off
+        engine is LISTS (the original pure Python renderer) or NUMPY, which
+        keeps the gradient and the whole strip in preallocated uint32 arrays
+        and hands the finished frame to the strip in one bulk slice assignment
+        strip is an already constructed PixelStrip (e.g. the headless one) to
+        use instead of creating one from the LED_* settings
+        clock_time and clock_sleep are the clock used for animation timing
+        pipelined=True composes each frame while the previous one is being
+        sent to the strip by an output thread (see pipeline.py)
+        """
+        #----------------------- neopixel stuff
+        self._led_count = led_count
+        self._max_brightness = 0
+        self._time = clock_time
+        self._sleep = clock_sleep
+        self._stats = None              # render_stats.RenderStats when instrumentation is switched on
+        self._stats_dump_path = None    # where _dump_stats writes them at exit
+        if strip is None:
+            strip = PixelStrip(led_count, LED_PIN, LED_FREQ_HZ,
+            LED_DMA, LED_INVERT, self._max_brightness, LED_CHANNEL)
+        else:
+            strip.setBrightness(self._max_brightness)
+        if pipelined:
+            strip = PipelinedStrip(strip)
+        self._pat_strip = strip # This is where the WS2812 library stores its stuff
+
+        #----------------------- NumPy engine buffers (only allocated when engine=NUMPY)
+        self._engine = engine
+        self._frame = None              # whole strip is composed here then sent in one go
+        self._frame_out = None          # memoryview of _frame, handed to the strip each frame
+        self._frame_segs = None         # _pat_line viewed as (segments, seg_size) for mirroring
+        self._gra_arr = None            # gradient written out twice so any rotation is one slice
+        self._pat_frame = None          # where the pattern is composed: _frame, or palette indexes
+        self._palette = None            # colour of each palette index, None = not indexed
+        self._pat_line = None           # where the segments are composed: _pat_frame, or the line a layout is gathered from
+        if engine == NUMPY:
+            self._frame = self._pat_frame = self._pat_line = numpy.zeros(led_count, numpy.uint32)
+            self._frame_out = memoryview(self._frame)
+            self._gra_arr = numpy.zeros(led_count*2, numpy.uint32)
+
+        #----------------------- Brightness layer and colour correction (NUMPY only, allocated when first used)
+        self._alpha = None              # brightness of each LED, 0-255, None = no layer
+        self._alpha_base = None         # the layer as set, before a layer fade scales it
+        self._correction = None         # correction.ColourCorrection, None = send colours as they are
+        self._lit = None                # _frame with the layer and correction applied, what gets sent
+        self._lit_out = None            # memoryview of _lit
+        self._lit_bytes = None          # _lit and _frame viewed as (LEDs, 4) bytes
+        self._frame_bytes = None
+        self._lut_ix = None             # index of each byte in _SCALE_LUT
+
+        #----------------------- Fade
+        self._fade_blend = None         # square wave or sawtooth
+        self._fade_min = 0              # dimmest value
+        self._fade_max = 100            # brightest value
+        self._fade_steps_per_repeat = 0 # how long the fade cycle is (0 = no fading)
+        self._fade_s_per_repeat = None  # how long the fade cycle is
+        self._fade_steps_per_half = None # half a cycle
+        self._fade_s_per_step = None    # how long each frame in the fade is
+        self._fade_t_start = 0          # when the cycle began
+        self._fade_layer = False        # fade the brightness layer rather than the whole strip
+        self._fade_first = 0            # first LED of the faded region (layer only)
+        self._fade_levels = None        # brightness for each step of the cycle, *256 (layer only)
+        self._fade_offsets = None       # how far ahead in the cycle each LED of the region is
+        self._fade_ix = None            # scratch: step for each LED of the region
+        self._fade_lut_ix = None        # scratch: index of each LED's brightness in _SCALE_LUT
+        self._fade_step_now = 0         # step of the fade cycle last drawn
+
+        #----------------------- Sparkle
+        self._spark_count = 0           # Number of sparks to add in per step
+        self._sparkles = None           # preallocated vector of random indexes into the led data
+        self._spark_t_start = 0         # when this pattern of sparles started
+        self._spark_duration = None     # how long each pattern of sparkles lasts (secs)
+        self._spark_rng = numpy.random.default_rng() # reseeded by define_sparkle(s_seed=...)
+        self._spark_rand = None         # floats the RNG fills in place, scaled into _sparkles
+        self._spark_palette = None      # colours sparks are picked from
+        self._spark_pal_ix = None       # which palette colour each spark is
+        self._spark_colours = None      # colour of each spark
+        self._spark_decay = False       # each spark fades out over its own lifetime
+        self._spark_born = None         # when each spark was lit (decay only)
+        self._spark_age = None          # scratch for the age and then alpha of each spark
+        self._spark_due = None          # which sparks have burnt out
+
+        #----------------------- Moving spot
+        self._spot_size = 0             # Size of moving spot, 0 = off
+        self._spot_colour = None        # Colour of the moving spot
+        self._spot_t_start = None       # When current spot animation started
+        self._spot_s_per_step = None    # Sets the speed of the spot animation
+        self._spot_steps_per_repeat = None # Number of steps in spot animation
+        self._spot_reverse = None       # RepeatLooping type - repeat or reverse
+        self._spot_motion_now = None    # Direction of spot animation for this loop
+        self._spot_ix_now = -1          # Where the spot was last drawn (-1 = no spot)
+        self._spot_def = None           # define_spot arguments, to redo it for a new segment size
+
+        #----------------------- Main pattern
+        self._pat_motion_now = RIGHT    # Current direction of pattern motion
+        self._pat_reverse = REPEAT      # When pattern gets to end, does it repeat or reverse
+        self._pat_sequential = None     # Do you fill the segments from the whole gradient (True) or have the whole segment filled with the same colour (False)
+        # Segment stuff
+        self._pat_segments = 0          # How many copies of the gradient to be fitted into the pattern
+        self._pat_seg_size = 0
+        self._pat_seg_reverse = REPEAT  # Each segment is repeat or reverse of previous one
+        # Where are we in the animation
+        self._pat_t_start = 0
+        self._pat_s_per_step = 0
+        self._pat_steps_per_repeat = 0
+        self._pat_ix_now = 0            # Where the gradient was copied from for the current frame
+        # Gradient object and data
+        self._gra_desc = None
+        self._gra_data = [0]*led_count  # maximum size a segment can be
+        self._leds_in_use = None        # how many are actually being used
+        self._seg_list = None           # LISTS: segment 0 of this frame, built before it goes to the strip
+        self._lay_map = None            # position on the line of each LED of a layout or of uneven segments, None = neither
+        # Definition for the L2R1 motion - how far right and then left to go.
+        # These vary according to the segment size
+        self._l2r1_l = 0
+        self._l2r1_r = 0
+        self._l2r1_t = 0
+        self._l2r1_d = 0
+
+        #----------------------- Baked frame tables
+        self._pat_ix_tables = None      # {motion: pat_ix for each step}, None = calculate live
+        self._baked_frames = None       # composed strip for each pat_ix, None = render live
+
+        #----------------------- Crossfade
+        self._xfade_next = None         # Animator composing the incoming pattern, None = no crossfade
+        self._xfade_ready = None        # Future, done once the incoming pattern is set up
+        self._xfade_s = 0               # how long the crossfade takes
+        self._xfade_t_start = 0         # when it started (0 = waiting for the incoming pattern)
+
+        #----------------------- Change tracking
+        self._track_changes = False
+        self._keepalive_s = 0
+        self._changed = True            # set by the interface methods: must send next frame
+        self._last_sent = None          # what the last frame sent was made from
+        self._t_last_sent = 0
+
+        #----------------------- Live updates
+        self._pending = deque()         # (method name, args, kwargs) to apply before the next frame
+        self._wake = None               # asyncio.Event set by queue() to wake render_async early
+
+        #----------------------- Palette cycling (indexed patterns only)
+        self._pcyc_mode = ROTATE
+        self._pcyc_steps = 0            # steps in a cycle, 0 = not cycling
+        self._pcyc_s_per_step = None
+        self._pcyc_t_start = 0
+        self._pcyc_step_now = -1        # step the palette was last worked out for
+        self._pcyc_base = None          # the pattern's own palette
+        self._pcyc_from = None          # TWEEN: the pattern's colours...
+        self._pcyc_to = None            # ...and the colours they tween to
+        self._pcyc_def = None           # define_palette_cycle arguments, to redo it after a crossfade
+
+        self._pat_strip.begin()
+
+    #----------------------- Fade and sparkle stuff
+    def _fade_scale(self, f_min, f_max):
+        # the layer works on each LED's own brightness, so is independent of max_brightness
+        full = 255 if self._fade_layer else self._max_brightness
+        self._fade_min = int(full*f_min/100)
+        self._fade_max = int(full*f_max/100)
+        self._fade_steps_per_half = max(0, self._fade_max - self._fade_min)
+        self._fade_steps_per_repeat = self._fade_steps_per_half * 2
+        if self._fade_steps_per_repeat > 0:
+            self._fade_s_per_step = self._fade_s_per_repeat / self._fade_steps_per_repeat
+        else:
+            self._fade_s_per_step = 1
+           # ~ print('DEBUG:animator:65 min=', self._fade_min, ' max=', self._fade_max, ' steps=',self._fade_steps_per_repeat)
+
+    def _new_sparks(self, where=True):
+        """
+        Pick new places (and colours) for the sparks in where (all of them
+        by default) without allocating: the RNG fills _spark_rand in place
+        which is then scaled and truncated into the index buffers.
+        """
+        rand = self._spark_rand
+        self._spark_rng.random(out=rand)
+        rand *= self._leds_in_use
+        numpy.copyto(self._sparkles, rand, casting='unsafe', where=where)
+        if len(self._spark_palette) > 1:
+            self._spark_rng.random(out=rand)
+            rand *= len(self._spark_palette)
+            numpy.copyto(self._spark_pal_ix, rand, casting='unsafe', where=where)
+            numpy.take(self._spark_palette, self._spark_pal_ix, out=self._spark_colours)
+
+    def _render_sparks_decay(self, t_now):
+        """
+        Each spark is lit for _spark_duration from when it was born, fading
+        into the pattern underneath, and is replaced somewhere else as soon
+        as it goes out. Births are staggered so the number lit stays steady.
+        """
+        born = self._spark_born
+        age = self._spark_age
+        if self._spark_t_start == 0: # new set, spread the ages over the duration
+            self._spark_rng.random(out=age)
+            numpy.multiply(age, -self._spark_duration, out=born)
+            born += t_now
+            self._new_sparks()
+        else:
+            numpy.add(born, self._spark_duration, out=age) # when each goes out
+            numpy.less_equal(age, t_now, out=self._spark_due)
+            if self._spark_due.any():
+                numpy.copyto(born, t_now, where=self._spark_due)
+                self._new_sparks(self._spark_due)
+        self._spark_t_start = t_now # always changing
+        # alpha (out of 256) falls from 256 to 0 over the spark's life
+        numpy.subtract(t_now, born, out=age)
+        age *= -256 / self._spark_duration
+        age += 256
+        numpy.clip(age, 0, 256, out=age)
+        if self._engine == NUMPY:
+            alpha = age.astype(numpy.uint32)
+            self._frame[self._sparkles] = _mix(self._frame[self._sparkles], self._spark_colours, alpha)
+        else:
+            data = self._pat_strip.getPixels()
+            for i, colour, alpha in zip(self._sparkles.tolist(), self._spark_colours.tolist(), age.tolist()):
+                data[i] = _mix(data[i], colour, int(alpha))
+        return min(born.min() + self._spark_duration, t_now + self._spark_duration / SPARK_DECAY_STEPS)
+
+    def _render_fade_spark(self, t_now):
+        # First the sparkles - a random set of places lit for _spark_duration
+        if self._spark_count > 0:
+            if self._spark_decay:
+                t_next = self._render_sparks_decay(t_now)
+            else:
+                if t_now >= self._spark_t_start + self._spark_duration: # time to get a new set of sparkles
+                    self._new_sparks()
+                    self._spark_t_start = t_now
+                if self._engine == NUMPY: # one scatter write
+                    self._frame[self._sparkles] = self._spark_colours
+                else:
+                    data = self._pat_strip.getPixels()
+                    for i, colour in zip(self._sparkles.tolist(), self._spark_colours.tolist()):
+                        data[i] = colour
+                t_next = self._spark_t_start + self._spark_duration
+        else:
+            t_next = t_now + 1000
+
+        if self._fade_steps_per_repeat == 0: # No fading so return
+            return t_next
+
+        if self._fade_t_start == 0: self._fade_t_start = t_now
+
+        step = (t_now - self._fade_t_start) // self._fade_s_per_step
+        if self._fade_t_start + (step+1) * self._fade_s_per_step <= t_now: step += 1 # division rounded down
+        if step >= self._fade_steps_per_repeat:
+            step = 0
+            self._fade_t_start = t_now
+
+        if self._fade_layer: # look up each LED's brightness from its place in the cycle
+            step = int(step)
+            self._fade_step_now = step
+            ix = self._fade_ix
+            numpy.add(self._fade_offsets, step, out=ix)
+            ix %= self._fade_steps_per_repeat
+            # scale the layer's own brightness by the fade
+            region = slice(self._fade_first, self._fade_first+len(ix))
+            lut_ix = self._fade_lut_ix
+            numpy.take(self._fade_levels, ix, out=lut_ix)
+            lut_ix += self._alpha_base[region]
+            numpy.take(_SCALE_LUT, lut_ix, out=self._alpha[region])
+            return self._fade_t_start + (step+1) * self._fade_s_per_step
+
+        if self._fade_blend == STEP:
+            new_b = self._fade_min if step < self._fade_steps_per_half else self._fade_max
+        else:
+            if step < self._fade_steps_per_half: # ramping up
+                new_b = self._fade_min + step
+            else: # ramping down
+                new_b = self._fade_max - (step - self._fade_steps_per_half)
+
+        # Set the new value which mustn't be above the currently set max brightness
+        new_b = int(min(new_b, self._max_brightness))
+        if new_b != self._pat_strip.getBrightness():
+            self._pat_strip.setBrightness(new_b)
+
+        return self._fade_t_start + (step+1) * self._fade_s_per_step
+
+    #----------------------- Brightness layer and colour correction
+    # Each LED can have its own brightness (0-255) on top of the strip's
+    # global one. It's applied to the finished frame in one go: every colour
+    # byte is looked up in the scale table for its LED's brightness. Colour
+    # correction is another table lookup, per channel, applied after it.
+    def _output_init(self, what):
+        """Allocate the buffers for the output stages"""
+        if self._engine != NUMPY:
+            raise ValueError('the {0} needs the NUMPY engine'.format(what))
+        if self._lit is None:
+            n = self._led_count
+            self._lit = numpy.zeros(n, numpy.uint32)
+            self._lit_out = memoryview(self._lit)
+            self._lit_bytes = self._lit.view(numpy.uint8).reshape(n, 4)
+            self._frame_bytes = self._frame.view(numpy.uint8).reshape(n, 4)
+            self._lut_ix = numpy.zeros((n, 4), numpy.uint16)
+
+    def _layer_init(self):
+        self._output_init('brightness layer')
+        if self._alpha is None:
+            self._alpha = numpy.full(self._led_count, 255, numpy.uint8)
+            self._alpha_base = numpy.full(self._led_count, 255, numpy.uint8)
+
+    def _render_output(self):
+        """Apply the brightness layer and/or colour correction to _frame giving _lit"""
+        ix = self._lut_ix
+        frame_bytes = self._frame_bytes
+        if self._alpha is not None:
+            numpy.left_shift(self._alpha[:, None], 8, out=ix, dtype=numpy.uint16)
+            ix += frame_bytes
+            numpy.take(_SCALE_LUT, ix, out=self._lit_bytes)
+            frame_bytes = self._lit_bytes
+        if self._correction is not None:
+            self._correction.apply(frame_bytes, self._lit_bytes, ix)
+
+    #----------------------- Moving spot stuff
+    def _render_spot(self, t_now):
+        # Find out which step we're on in the pattern, need to calculate this
+        # as timing is important and we may need to skip steps to keep up
+        if self._spot_size == 0:
+            self._spot_ix_now = -1
+            return t_now + 1000
+
+        if self._spot_t_start == 0: self._spot_t_start = t_now
+
+        step = int((t_now - self._spot_t_start) // self._spot_s_per_step)
+        if self._spot_t_start + self._spot_s_per_step*(step+1) <= t_now: step += 1 # division rounded down
+        if step >= self._spot_steps_per_repeat: # Completed run, start again
+            step = 0
+            self._spot_t_start = t_now;
+            if self._spot_reverse == REVERSE:
+                self._spot_motion_now = LEFT if self._spot_motion_now == RIGHT else RIGHT
+
+        # Work out the direction we're going
+        if self._spot_motion_now == RIGHT: ix = step # Count up
+        else: ix = self._pat_seg_size - self._spot_size - step # Count down
+        # ~ print('DEBUG:animator: spot step=', step, '/', self._spot_steps_per_repeat,' spot ix=', ix)
+
+        # Paint the spot in its current position
+        # ~ print('DEBUG:animator: ix=', ix, ' _spot_size=', self._spot_size)
+        self._spot_ix_now = ix
+        if self._engine == NUMPY:
+            self._pat_line[ix:ix+self._spot_size] = PAL_SPOT if self._palette is not None else self._spot_colour
+        else:
+            self._seg_list[ix:ix+self._spot_size]=[self._spot_colour]*self._spot_size
+
+        return self._spot_t_start + self._spot_s_per_step*(step+1); # Theoretical start time for next step (may be past)
+
+    #----------------------- Main pattern
+    def _set_l2r1(self):
+        self._l2r1_l = max(2, self._pat_seg_size//5)
+        self._l2r1_r = max(1, self._l2r1_l//3)
+        self._l2r1_t = self._l2r1_l + self._l2r1_r
+        self._l2r1_d = self._l2r1_l - self._l2r1_r
+        # ~ print('DEBUG:animator: r=',self._l2r1_r,' l=',self._l2r1_l,' ss//t*t=',self._pat_seg_size//self._l2r1_t*self._l2r1_t)
+
+    def _pat_ix_for_step(self, step, motion):
+        """
+        Calculate start point for copying entries from the pattern palette (pat_ix)
+        Use the step number and the direction of motion
+        """
+        # Work out the direction we're going
+        if motion == LEFT or motion == STOP:
+            pat_ix = step # Count up
+        elif motion == RIGHT:
+            pat_ix = self._pat_seg_size-1 - step # Count down
+        elif motion == L2R1:
+            # This is the complicated one: turns out this does the trick! T=total(L,R), D=difference(L,R)
+            rem = step % self._l2r1_t
+            pat_ix = (step // self._l2r1_t) * self._l2r1_d + (rem if rem <= self._l2r1_l else self._l2r1_l - (rem - self._l2r1_l))
+            pat_ix = pat_ix % self._pat_seg_size # cope with wrap around
+        return pat_ix
+
+    # A pattern is periodic, so with bake=True define_pattern works out
+    # pat_ix for every step of every motion the pattern can be in and, if it
+    # fits in BAKE_MAX_BYTES, the complete strip (all segments) for every pat_ix.
+    # Rendering the pattern is then a table lookup and a copy.
+    def _bake_pattern(self, reverse):
+        """
+        Build the pat_ix tables and, memory permitting, the frame table for
+        the pattern just set up by define_pattern
+        """
+        motions = [self._pat_motion_now]
+        if reverse == REVERSE and self._pat_motion_now in (LEFT, RIGHT):
+            motions.append(RIGHT if self._pat_motion_now == LEFT else LEFT)
+        steps = max(1, self._pat_steps_per_repeat)
+        self._pat_ix_tables = {m: [self._pat_ix_for_step(step, m) for step in range(steps)] for m in motions}
+
+        seg_size = self._pat_seg_size
+        line_size = seg_size * self._pat_segments
+        rows = 1 if self._pat_motion_now == STOP else seg_size
+        if rows * self._leds_in_use * (self._gra_arr.itemsize if self._engine == NUMPY else 8) > BAKE_MAX_BYTES:
+            self._baked_frames = None # too big, carry on rendering live
+            return
+        if self._engine == NUMPY:
+            frames = numpy.empty((rows, self._pat_segments, seg_size), self._gra_arr.dtype)
+            if self._pat_sequential: # row p is the gradient rotated by p
+                frames[:, 0] = numpy.lib.stride_tricks.sliding_window_view(self._gra_arr[0:2*seg_size], seg_size)[0:rows]
+            else:
+                frames[:, 0] = self._gra_arr[0:rows, None]
+            if self._pat_seg_reverse == REPEAT:
+                frames[:, 1:] = frames[:, 0:1]
+            else:
+                frames[:, 2::2] = frames[:, 0:1]
+                frames[:, 1::2] = frames[:, 0:1, ::-1]
+            self._baked_frames = frames.reshape(rows, line_size)
+            if self._lay_map is not None: # store the gathered frames
+                self._baked_frames = self._baked_frames[:, self._lay_map]
+        else:
+            gra_data = self._gra_data
+            self._baked_frames = []
+            for pat_ix in range(rows):
+                if self._pat_sequential:
+                    seg = gra_data[pat_ix:seg_size]+gra_data[:pat_ix]
+                else:
+                    seg = [gra_data[pat_ix]]*seg_size
+                frame = []
+                for i in range(self._pat_segments):
+                    frame += seg if i % 2 == 0 or self._pat_seg_reverse == REPEAT else seg[::-1]
+                if self._lay_map is not None:
+                    frame = [frame[p] for p in self._lay_map]
+                self._baked_frames.append(frame)
+
+    def _render_segment(self, t_now):
+        # Find out which step we're on in the pattern, need to calculate this as timing is
+        # important and we may need to skip steps to keep up
+
+        # _pat_t_start is set to 0 by define_pattern to indicate 'start again'
+        if self._pat_t_start == 0:
+            self._pat_t_start = t_now
+
+        # ~ print("DEBUG:animator: _pat_motion_now=",self._pat_motion_now)
+        if self._pat_motion_now == STOP:
+            step = 0
+        else:
+            step = int(((t_now - self._pat_t_start) / self._pat_s_per_step) + 0.5)
+            if step >= self._pat_steps_per_repeat: # completed pattern, start again
+                step = 0;
+                if self._pat_motion_now != L2R1:
+                    if self._pat_reverse == REVERSE:
+                        self._pat_motion_now = RIGHT if self._pat_motion_now == LEFT else LEFT
+                self._pat_t_start = t_now
+        if self._stats is not None: self._stats.pattern_step(step)
+        if self._pat_ix_tables is not None:
+            pat_ix = self._pat_ix_tables[self._pat_motion_now][step]
+        else:
+            pat_ix = self._pat_ix_for_step(step, self._pat_motion_now)
+        self._pat_ix_now = pat_ix
+
+        # ~ print('DEBUG:animator: step=',step, 'LEFT' if self._pat_motion_now==LEFT else 'RIGHT' if self._pat_motion_now==RIGHT else 'L2R1', "pat_seg=", self._pat_seg_size, " pat_ix=", pat_ix)
+        seg_size = self._pat_seg_size
+        if self._baked_frames is not None and (self._spot_size == 0 or (self._engine == NUMPY and self._lay_map is None)):
+            # the whole strip is ready made, segments and all (LISTS or a layout
+            # with a spot builds it below, as the spot has to go in every segment)
+            if self._engine == NUMPY:
+                self._pat_frame[0:self._leds_in_use] = self._baked_frames[pat_ix]
+            else:
+                self._pat_strip.getPixels()[0:self._leds_in_use] = self._baked_frames[pat_ix]
+        elif self._engine == NUMPY: # _gra_arr is doubled up so the rotation is a single slice
+            if self._pat_sequential:
+                self._pat_line[0:seg_size] = self._gra_arr[pat_ix:pat_ix+seg_size]
+            else:
+                self._pat_line[0:seg_size] = self._gra_arr[pat_ix]
+        elif self._pat_sequential: # copy the gradient into the segment, offset by the pat_ix
+            self._seg_list = self._gra_data[pat_ix:seg_size]+self._gra_data[:pat_ix]
+        else: # non-sequential means the whole segment is the same colour
+            self._seg_list = [self._gra_data[pat_ix]]*seg_size
+
+        if self._pat_motion_now == STOP:
+            return t_now + 10 # no need but it seems nice to refresh every now and again!
+        else:
+            return self._pat_t_start + self._pat_s_per_step*(step+1); # Theoretical start time for next step (may be past)
+
+    def _render_segments_numpy(self):
+        """
+        Copy segment 0 into all the others with (at most) two vectorised writes,
+        then gather a layout's LEDs from the line in one more
+        """
+        if self._pat_segments > 1:
+            frame_segs = self._frame_segs
+            if self._pat_seg_reverse == REPEAT:
+                frame_segs[1:] = frame_segs[0]
+            else: # odd numbered segments go in backwards
+                frame_segs[2::2] = frame_segs[0]
+                frame_segs[1::2] = frame_segs[0, ::-1]
+        if self._lay_map is not None:
+            numpy.take(self._pat_line, self._lay_map, out=self._pat_frame[0:self._leds_in_use], mode='clip')
+
+    def _render_palette(self):
+        """
+        Indexed patterns: look every LED's colour up in the palette, into _frame
+        """
+        self._palette[PAL_SPOT] = self._spot_colour if self._spot_size != 0 else RGB_Black
+        numpy.take(self._palette, self._pat_frame, out=self._frame)
+
+    #----------------------- Palette cycling
+    # With an indexed pattern the colours can change while the pattern (the
+    # indexes) stays as it is: only the palette is worked out again, once per
+    # step. ROTATE shifts the used palette entries along one place per step
+    # (classic colour cycling), TWEEN blends the gradient's colours to
+    # another set and back.
+    def _render_palette_cycle(self, t_now):
+        if self._pcyc_t_start == 0: self._pcyc_t_start = t_now
+        step = int((t_now - self._pcyc_t_start) // self._pcyc_s_per_step)
+        if self._pcyc_t_start + (step+1) * self._pcyc_s_per_step <= t_now: step += 1 # division rounded down
+        if step >= self._pcyc_steps:
+            step = 0
+            self._pcyc_t_start = t_now
+        if step != self._pcyc_step_now:
+            self._pcyc_step_now = step
+            pal = self._palette; base = self._pcyc_base
+            if self._pcyc_mode == ROTATE:
+                n = self._pcyc_steps
+                pal[0:n-step] = base[step:n]
+                pal[n-step:n] = base[0:step]
+            else:
+                k = step if step <= PALETTE_STEPS else 2*PALETTE_STEPS - step
+                colours = _mix(self._pcyc_from, self._pcyc_to, k * 256 // PALETTE_STEPS)
+                pal[:] = self._gra_desc.palette(colours.tolist())
+        return self._pcyc_t_start + (step+1) * self._pcyc_s_per_step
+
+    def _render_segments_lists(self):
+        """
+        Build the whole frame from segment 0 (spot and all) as one list and
+        write it to the strip once. Nothing is read back from the strip, which
+        on the real driver is a slow copy through the C wrapper every time.
+        """
+        seg = self._seg_list
+        segments = self._pat_segments
+        if segments < 2:
+            frame = seg
+        elif self._pat_seg_reverse == REPEAT:
+            frame = seg * segments
+        else: # odd numbered segments go in backwards
+            frame = (seg + seg[::-1]) * (segments // 2)
+            if segments % 2: frame += seg
+        if self._lay_map is not None:
+            frame = [frame[p] for p in self._lay_map]
+        self._pat_strip.getPixels()[0:self._leds_in_use] = frame
+
+    #----------------------- Crossfade
+    # define_pattern(..., transition_s) sets the new pattern up in a second,
+    # private Animator, in a background thread, while the old one carries on.
+    # Once it's ready both are composed each frame and mixed, the new one
+    # weighted more each step; at the end the new pattern's state is taken
+    # over and the second Animator dropped.
+    def _render_crossfade(self, t_now):
+        """
+        Mix the incoming pattern into _frame, return when the next step is due
+        """
+        nxt = self._xfade_next
+        if self._xfade_t_start == 0:
+            if self._sleep is sleep and not self._xfade_ready.done(): # virtual time waits, so the result doesn't depend on thread timing
+                return t_now + self._xfade_s / XFADE_STEPS # show the old pattern until it is
+            try:
+                self._xfade_ready.result() # raise anything that went wrong setting it up
+            except BaseException:
+                self._xfade_next = self._xfade_ready = None # carry on with the old pattern
+                raise
+            self._xfade_t_start = t_now
+        self._changed = True # every step of the crossfade gets sent
+        step = int((t_now - self._xfade_t_start) * XFADE_STEPS / self._xfade_s)
+        pat_t_next = nxt._render_segment(t_now)
+        if nxt._baked_frames is None or nxt._spot_size != 0: # as render_frame: a baked frame is complete
+            nxt._render_segments_numpy()
+        if nxt._palette is not None: nxt._render_palette()
+        if step >= XFADE_STEPS: # finished, the incoming pattern takes over
+            seg_size = self._pat_seg_size
+            for name in _PATTERN_STATE:
+                setattr(self, name, getattr(nxt, name))
+            self._frame[:] = nxt._frame
+            if self._palette is None: # not nxt's _frame
+                self._pat_frame = self._frame
+            if self._lay_map is None:
+                self._pat_line = self._pat_frame
+            self._frame_segs = self._pat_line[0:self._pat_segments*self._pat_seg_size].reshape(self._pat_segments, self._pat_seg_size)
+            self._xfade_next = self._xfade_ready = None
+            if self._pcyc_steps != 0: # was cycling the old palette, start again on the new one
+                self._pcyc_steps = 0
+                p_secs, p_mode, p_colours = self._pcyc_def
+                # a TWEEN needs a colour for each of the new gradient's, else cycling just stops
+                if self._palette is not None and (p_mode != TWEEN or len(p_colours) == len(self._gra_desc.colours)):
+                    self.define_palette_cycle(*self._pcyc_def)
+            if self._spot_size != 0 and self._pat_seg_size != seg_size: # spot was sized for the old pattern
+                self.define_spot(*self._spot_def)
+            return pat_t_next
+        self._frame[:] = _mix(self._frame, nxt._frame, step * 256 // XFADE_STEPS)
+        return min(pat_t_next, self._xfade_t_start + (step+1) * self._xfade_s / XFADE_STEPS)
+
+    #----------------------- Change tracking
+    # When switched on, a frame is only sent to the strip if something that
+    # affects what it looks like has changed since the last one sent: where
+    # the gradient and spot were drawn, the set of sparkles, the brightness or
+    # any of the define_* settings. keepalive_s resends an unchanged frame
+    # every so often anyway (0 = never), and render_frame returns by then at
+    # the latest so a STOPped pattern still gets resent.
+    def _frame_changed(self, t_now):
+        """
+        Decide whether the frame just rendered needs sending to the strip
+        """
+        if not self._track_changes:
+            return True
+        state = (self._pat_ix_now, self._spot_ix_now, self._spark_t_start if self._spark_count > 0 else 0,
+            self._pat_strip.getBrightness(), self._fade_step_now if self._fade_layer else 0,
+            self._pcyc_step_now if self._pcyc_steps != 0 else 0)
+        if (self._changed or state != self._last_sent
+                or (self._keepalive_s > 0 and t_now >= self._t_last_sent + self._keepalive_s)):
+            self._changed = False
+            self._last_sent = state
+            self._t_last_sent = t_now
+            return True
+        return False
+
+    def _keepalive_due(self, t_next):
+        """
+        Bring t_next forward to when the next keepalive frame is due
+        """
+        if self._track_changes and self._keepalive_s > 0:
+            return min(t_next, self._t_last_sent + self._keepalive_s)
+        return t_next
+
+    def render_frame(self):
+        """
+        Call all the renderers to build up the current state and then show on the LED strip
+        Return the time of the next frame
+        """
+
+        if self._pending: # settings changed while we were waiting
+            self._apply_pending()
+        t_now = self._time() # Use the same time throughout the calculations
+        stats = self._stats
+        if stats is not None:
+            stats.frame_start(t_now)
+            t_start = t_stage = perf_counter()
+
+        # Handle blanking
+        if (self._max_brightness == 0):
+            if self._frame_changed(t_now):
+                self._pat_strip.show()
+            t_next = self._keepalive_due(t_now + 1)
+            if stats is not None: stats.frame_done(t_start, t_next)
+            return t_next
+
+        # copy the gradient into first segment at the right place (phase shift)
+        pat_t_next = self._render_segment(t_now)
+        if stats is not None: t_stage = stats.stage(render_stats.SEGMENT, t_stage)
+
+        # draw the moving spot on top
+        spot_t_next = self._render_spot(t_now)
+        if stats is not None: t_stage = stats.stage(render_stats.SPOT, t_stage)
+
+        # copy into the other segments (LISTS: and write the frame to the strip)
+        # (a baked frame already has them unless the spot needs copying too)
+        if self._baked_frames is None or self._spot_size != 0:
+            if self._engine == NUMPY:
+                self._render_segments_numpy()
+            else:
+                self._render_segments_lists()
+        if self._palette is not None:
+            if self._pcyc_steps != 0:
+                pat_t_next = min(pat_t_next, self._render_palette_cycle(t_now))
+            self._render_palette()
+        if self._xfade_next is not None:
+            pat_t_next = min(pat_t_next, self._render_crossfade(t_now))
+        if stats is not None: t_stage = stats.stage(render_stats.MIRROR, t_stage)
+
+        # apply any sparkles and fade pattern
+        fade_t_next = self._render_fade_spark(t_now)
+        if stats is not None: t_stage = stats.stage(render_stats.FADE_SPARK, t_stage)
+
+        # Send the data to the LED strip
+        if self._frame_changed(t_now):
+            if self._alpha is not None or self._correction is not None:
+                self._render_output()
+                self._pat_strip.getPixels()[0:self._led_count] = self._lit_out
+            elif self._engine == NUMPY:
+                self._pat_strip.getPixels()[0:self._led_count] = self._frame_out
+            self._pat_strip.show()
+        elif stats is not None:
+            stats.frame_unchanged()
+        #print("{0:3.2f} {1:3.2f} {2:3.2f} {3:3.2f} ".format(t_now, time(), pat_t_next, spot_t_next))
+        # Work out the soonest step to be done
+        t_next = self._keepalive_due(min(pat_t_next, fade_t_next, spot_t_next))
+        if stats is not None:
+            stats.stage(render_stats.SHOW, t_stage)
+            stats.frame_done(t_start, t_next)
+        return t_next
+
+    #----------------------- Live updates
+    # Changes queued while rendering are all applied together just before
+    # the next frame, so a frame never shows half a change.
+    def queue(self, method, *args, **kwargs):
+        """
+        Queue a call to one of the LIVE_UPDATES methods, e.g.
+        anim.queue('define_spot', 3, RGB_Green), to be made before the next
+        frame. Wakes render_async so the change shows straight away.
+        Call from the event loop's thread (from another thread use
+        loop.call_soon_threadsafe(anim.queue, ...)).
+        """
+        if method not in LIVE_UPDATES:
+            raise ValueError('{0} cannot be queued, use one of {1}'.format(method, LIVE_UPDATES))
+        self._pending.append((method, args, kwargs))
+        if self._wake is not None:
+            self._wake.set()
+
+    def _apply_pending(self):
+        while self._pending:
+            method, args, kwargs = self._pending.popleft()
+            getattr(self, method)(*args, **kwargs)
+
+    async def render_async(self, stop_time=0):
+        """
+        Coroutine version of render: waits between frames without blocking
+        the event loop, and starts the next frame early if a change is
+        queued. With a virtual clock it sleeps on that clock and just
+        yields to the event loop between frames.
+        """
+        self._wake = wake = asyncio.Event()
+        try:
+            while self._time() < stop_time:
+                wake.clear()
+                t_next = self.render_frame()
+                if stop_time != 0: t_next = min(t_next, stop_time)
+                pause = t_next - self._time()
+                if self._sleep is not sleep: # virtual time
+                    if pause > 0 and not self._pending: self._sleep(pause)
+                    await asyncio.sleep(0)
+                elif pause > 0 and not self._pending:
+                    try:
+                        await asyncio.wait_for(wake.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            self._wake = None
+
+    #----------------------- Interface methods, see the anim_* functions
+    def stop(self):
+        #~ self._pat_strip.getPixels()[:]=[RGB_Black]*self._pat_strip.numPixels()
+        self.set_max_brightness(0)
+        self._pat_strip.show()
+        if isinstance(self._pat_strip, PipelinedStrip):
+            self._pat_strip.wait()
+
+    def define_pattern(self, g_desc, segments=1, seg_reverse=REPEAT, motion=RIGHT, repeat_s=10, reverse=REPEAT, bake=False,
+            transition_s=0, indexed=False, layout=None, along=X_AXIS, positions=0, seg_sizes=None):
+        global _prepare_pool
+        self._changed = True
+        if indexed and self._engine != NUMPY:
+            raise ValueError('indexed patterns need the NUMPY engine')
+        if indexed and len(g_desc.colours) > PAL_SIZE:
+            raise ValueError('an indexed pattern can have up to {0} colours, not {1}'.format(PAL_SIZE, len(g_desc.colours)))
+        if seg_sizes is not None:
+            if layout is not None:
+                raise ValueError('seg_sizes and layout cannot be used together')
+            if not seg_sizes or min(seg_sizes) <= 0 or sum(seg_sizes) > self._led_count:
+                raise ValueError('seg_sizes must be positive and add up to at most {0} LEDs'.format(self._led_count))
+        self._xfade_next = self._xfade_ready = None # a new pattern replaces any crossfade going on
+        if transition_s > 0 and self._leds_in_use is not None: # crossfade from the current pattern
+            if self._engine != NUMPY:
+                raise ValueError('crossfades need the NUMPY engine')
+            if _prepare_pool is None:
+                _prepare_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pattern-prep')
+            nxt = Animator(self._led_count, NUMPY, _NoStrip(), self._time, self._sleep)
+            self._xfade_ready = _prepare_pool.submit(nxt.define_pattern, g_desc, segments, seg_reverse, motion, repeat_s, reverse, bake,
+                indexed=indexed, layout=layout, along=along, positions=positions, seg_sizes=seg_sizes)
+            self._xfade_next = nxt
+            self._xfade_s = transition_s
+            self._xfade_t_start = 0
+            return
+        self._spot_size = 0 # mustn't run spot for previous pattern in case segment size changes
+        self._pcyc_steps = 0 # nor cycle its palette
+
+        self._gra_desc = g_desc
+
+        if layout is not None: # the segments make a line of positions along an axis
+            line_size = min(positions if positions > 0 else layout.size(along), self._led_count)
+        elif seg_sizes is not None: # one segment, spread over each of seg_sizes
+            line_size = max(seg_sizes)
+        else:
+            line_size = self._led_count
+        if segments <= 0: # asking all LEDS to change colour together
+            self._pat_sequential = False
+            self._pat_segments = 1
+        elif seg_sizes is not None:
+            self._pat_sequential = True
+            self._pat_segments = 1
+        else:
+            self._pat_sequential = True
+            self._pat_segments = min(segments, line_size) # can't have segments smaller than one LED
+        self._pat_seg_size = seg_size = line_size // self._pat_segments
+        self._set_l2r1()
+        line_size = seg_size * self._pat_segments
+        if layout is not None:
+            self._leds_in_use = min(len(layout), self._led_count)
+            self._lay_map = layout.positions(along, line_size)[0:self._leds_in_use]
+        elif seg_sizes is not None:
+            self._leds_in_use = sum(seg_sizes)
+            self._lay_map = _segment_map(seg_sizes, line_size, seg_reverse)
+        else:
+            self._leds_in_use = line_size
+            self._lay_map = None
+        if self._lay_map is not None and self._engine != NUMPY:
+            self._lay_map = self._lay_map.tolist()
+
+        self._pat_seg_reverse = seg_reverse
+
+        self._pat_motion_now = motion
+        # ~ print("DEBUG:animator: motion=",motion,"seg_sz=",seg_size)
+        if motion == LEFT or motion == RIGHT:
+            self._pat_steps_per_repeat = seg_size
+        elif motion == L2R1:
+            # This is hard because _l2r1_d is not 1 so not every length can be exactly accommodated
+            wholes = seg_size // self._l2r1_d
+            rem = seg_size % self._l2r1_d
+            self._pat_steps_per_repeat = self._l2r1_t * wholes + rem
+            # ~ print('DEBUG:animator: seg_size',seg_size, 'steps_per_repeat',self._pat_steps_per_repeat)
+        else: # stop
+            self._pat_steps_per_repeat = 0;
+
+        if motion != STOP: self._pat_s_per_step = float(repeat_s) / self._pat_steps_per_repeat
+        # ~ print("DEBUG:animator: s_per_step=",self._pat_s_per_step)
+
+        self._pat_reverse = reverse
+
+        # regenerate the gradient
+        if self._engine == NUMPY:
+            if indexed: # compose uint8 palette indexes, a quarter of the data to move about
+                if self._pat_frame is self._frame:
+                    self._pat_frame = numpy.zeros(self._led_count, numpy.uint8)
+                    self._gra_arr = numpy.zeros(self._led_count*2, numpy.uint8)
+                self._palette = g_desc.palette()
+                gra = g_desc.render_indexed(seg_size); black = PAL_BLACK
+            else:
+                if self._pat_frame is not self._frame:
+                    self._pat_frame = self._frame
+                    self._gra_arr = numpy.zeros(self._led_count*2, numpy.uint32)
+                self._palette = None
+                gra = g_desc.render_array(seg_size); black = RGB_Black
+            self._gra_arr[0:seg_size] = gra
+            self._gra_arr[seg_size:2*seg_size] = self._gra_arr[0:seg_size]
+            self._pat_frame[self._leds_in_use:] = black # leftover LEDs stay dark
+            if self._lay_map is not None:
+                self._pat_line = numpy.zeros(line_size, self._pat_frame.dtype)
+            else:
+                self._pat_line = self._pat_frame
+            self._frame_segs = self._pat_line[0:line_size].reshape(self._pat_segments, seg_size)
+        else:
+            g_desc.render(seg_size, self._gra_data)
+
+        if bake:
+            self._bake_pattern(reverse)
+        else:
+            self._pat_ix_tables = None; self._baked_frames = None
+
+        # request restart of the animation
+        self._pat_t_start = 0
+        # ~ print('DEBUG:animator: seg_size',seg_size,'tot',self._leds_in_use)
+
+    def define_spot(self, s_size, s_colour, s_motion=RIGHT, s_secs=5, s_reverse=REVERSE):
+        self._changed = True
+        self._spot_def = (s_size, s_colour, s_motion, s_secs, s_reverse)
+        if s_size <= 0:
+            self._spot_size = 0
+        else:
+            self._spot_size = max(1, s_size*self._pat_seg_size // 32)
+            # ~ print('DEBUG:animator: spot_sz=', self._spot_size)
+            self._spot_steps_per_repeat = self._pat_seg_size - self._spot_size; # Prevent overflow
+
+        self._spot_colour = s_colour
+        self._spot_motion_now = s_motion
+        self._spot_s_per_step = float(s_secs) / self._pat_seg_size
+        self._spot_reverse = s_reverse
+
+        # request restart of the animation
+        self._spot_t_start = 0
+
+    def define_sparkle(self, s_per_k, s_duration=0.1, s_colour=RGB_White, s_decay=False, s_seed=None):
+        self._changed = True
+        self._spark_count = count = s_per_k * self._leds_in_use // 1000
+        self._spark_duration = s_duration
+        self._spark_decay = s_decay
+        if s_seed is not None:
+            self._spark_rng = numpy.random.default_rng(s_seed)
+        palette = s_colour if isinstance(s_colour, (list, tuple)) else [s_colour]
+        self._spark_palette = numpy.array(palette, numpy.uint32)
+        # buffers are sized here, once, and reused for every new set of sparks
+        self._sparkles = numpy.zeros(count, numpy.intp)
+        self._spark_rand = numpy.zeros(count)
+        self._spark_pal_ix = numpy.zeros(count, numpy.intp)
+        self._spark_colours = numpy.full(count, palette[0], numpy.uint32)
+        self._spark_born = numpy.zeros(count)
+        self._spark_age = numpy.zeros(count)
+        self._spark_due = numpy.zeros(count, bool)
+        self._spark_t_start = 0 # start a new set
+
+    def define_fade(self, f_secs, f_blend=SMOOTH, f_min=0, f_max=100, f_layer=False, f_first=0, f_count=0, f_waves=0):
+        if f_layer and f_secs > 0 and not 0 <= f_first < self._led_count:
+            raise ValueError('f_first must be an LED on the strip, 0 to {0}'.format(self._led_count-1))
+        self._changed = True
+        if self._fade_layer: # the region goes back to the layer's own brightness
+            region = slice(self._fade_first, self._fade_first+len(self._fade_offsets))
+            self._alpha[region] = self._alpha_base[region]
+        elif self._fade_steps_per_repeat != 0: # and the strip to max_brightness
+            self._pat_strip.setBrightness(self._max_brightness)
+        self._fade_layer = False
+        if f_secs <= 0: # switch off fading
+            self._fade_steps_per_repeat = 0
+            return
+
+        self._fade_blend = f_blend
+        self._fade_s_per_repeat = f_secs
+        if f_layer:
+            self._layer_init()
+            self._fade_layer = True
+        self._fade_scale(f_min, f_max)
+        if f_layer:
+            steps = self._fade_steps_per_repeat
+            half = self._fade_steps_per_half
+            s = numpy.arange(steps)
+            if f_blend == STEP:
+                levels = numpy.where(s < half, self._fade_min, self._fade_max)
+            else:
+                levels = numpy.where(s < half, self._fade_min + s, self._fade_max - (s - half))
+            self._fade_levels = levels.astype(numpy.uint16) << 8
+            count = self._led_count - f_first # can't go past the end of the strip
+            if f_count > 0: count = min(f_count, count)
+            self._fade_first = f_first
+            # f_waves whole cycles fit across the region, so the fade travels along it
+            self._fade_offsets = numpy.arange(count) * (steps * f_waves) // count
+            self._fade_ix = numpy.zeros(count, int)
+            self._fade_lut_ix = numpy.zeros(count, numpy.uint16)
+
+    def set_max_brightness(self, new_b):
+        self._changed = True
+        if new_b != self._max_brightness:
+            old_b = self._max_brightness; self._max_brightness = new_b
+            # Re-scale the fade min and max values if fading is going on
+            if self._fade_steps_per_repeat != 0 and not self._fade_layer:
+                self._fade_scale(self._fade_min*100/old_b, self._fade_max*100/old_b)
+            self._pat_strip.setBrightness(self._max_brightness)
+
+    def set_brightness_layer(self, alpha):
+        self._changed = True
+        if alpha is None and not self._fade_layer:
+            self._alpha = None # back to sending _frame as it is
+            return
+        self._layer_init()
+        self._alpha_base[:] = 255 if alpha is None else alpha
+        self._alpha[:] = self._alpha_base # a layer fade scales its region again next frame
+
+    def set_colour_correction(self, cc):
+        self._changed = True
+        if cc is not None:
+            self._output_init('colour correction')
+        old, self._correction = self._correction, cc
+        if hasattr(self._pat_strip, 'setGamma'): # the strip does gamma, after its brightness scaling
+            if cc is not None and cc.gamma is not None:
+                self._pat_strip.setGamma(cc.gamma_table())
+            elif old is not None and old.gamma is not None: # undo the last one
+                self._pat_strip.setGamma(list(range(256)))
+
+    def define_palette_cycle(self, p_secs, p_mode=ROTATE, p_colours=None):
+        self._changed = True
+        if self._pcyc_steps != 0: # back to the pattern's own colours
+            self._palette[:] = self._pcyc_base
+        self._pcyc_steps = 0
+        self._pcyc_def = (p_secs, p_mode, p_colours)
+        if p_secs <= 0: # switch off cycling
+            return
+        if self._palette is None:
+            raise ValueError('palette cycling needs an indexed pattern (define_pattern(..., indexed=True))')
+        self._pcyc_base = self._palette.copy()
+        self._pcyc_mode = p_mode
+        if p_mode == ROTATE:
+            steps = self._gra_desc.palette_size()
+        else:
+            if p_colours is None or len(p_colours) != len(self._gra_desc.colours):
+                raise ValueError('TWEEN needs p_colours, {0} of them'.format(len(self._gra_desc.colours)))
+            self._pcyc_from = numpy.array(self._gra_desc.colours, numpy.uint32)
+            self._pcyc_to = numpy.array(p_colours, numpy.uint32)
+            steps = 2 * PALETTE_STEPS
+        self._pcyc_steps = steps
+        self._pcyc_s_per_step = p_secs / steps
+        self._pcyc_t_start = 0
+        self._pcyc_step_now = -1
+
+    def set_clock(self, clock_time=time, clock_sleep=sleep):
+        self._time = clock_time; self._sleep = clock_sleep
+
+    def track_changes(self, on=True, keepalive_s=1):
+        self._track_changes = on
+        self._keepalive_s = keepalive_s
+        self._changed = True
+
+    def enable_stats(self, dump_path=None, late_s=0.002):
+        self._stats = render_stats.RenderStats(late_s)
+        self._stats_dump_path = dump_path
+        atexit.unregister(self._dump_stats) # only ever registered once
+        if dump_path is not None:
+            atexit.register(self._dump_stats)
+
+    def _dump_stats(self):
+        """
+        atexit handler: write the current stats, if still wanted
+        """
+        if self._stats is not None and self._stats_dump_path is not None:
+            self._stats.dump(self._stats_dump_path)
+
+    def disable_stats(self):
+        self._stats = None
+
+    def get_stats(self):
+        return self._stats.summary() if self._stats is not None else None
+
+    def render(self, stop_time=0):
+        while self._time() < stop_time:
+            t_next = self.render_frame()
+            if stop_time != 0: t_next = min(t_next, stop_time)
+            pause = t_next - self._time()
+            if pause > 0: self._sleep(pause)
 
-    # copy the gradient into first segment at the right place (phase shift)
-    pat_t_next = _render_segment(t_now)
-    
-    # draw the moving spot on top
-    spot_t_next = _render_spot(t_now)
-    
-    # for multi-segment patterns, copy into the other segments
-    for i in range(1, _pat_segments):
-        s_off = i*_pat_seg_size
-        strip_data = _pat_strip.getPixels()
-        if i % 2 == 0 or _pat_seg_reverse == REPEAT: # this segment is in forwards
-            strip_data[s_off:s_off+_pat_seg_size]=strip_data[0:_pat_seg_size]
-        else: # have to put this segment in backwards
-            strip_data[s_off:s_off+_pat_seg_size]=strip_data[0:_pat_seg_size][::-1]
-        
-    # apply any sparkles and fade pattern
-    fade_t_next = _render_fade_spark(t_now)
-
-    # Send the data to the LED strip
-    _pat_strip.show()
-    #print("{0:3.2f} {1:3.2f} {2:3.2f} {3:3.2f} ".format(t_now, time(), pat_t_next, spot_t_next))
-    # Work out the soonest step to be done
-    return min(pat_t_next, fade_t_next, spot_t_next)
 #
 # -------------------------- INTERFACE FUNCTIONS ----------------------
+# These all work on the default Animator created by anim_init
 #
-def anim_init(led_count):
+_anim = None
+_time = time # clock given to the next anim_init, see anim_set_clock
+_sleep = sleep
+
+def anim_init(led_count, engine=LISTS, strip=None, pipelined=False):
     """
     Initial set up of the system for animations
     Clears everything out and switches things off
+    engine is LISTS (the original pure Python renderer) or NUMPY, which
+    keeps the gradient and the whole strip in preallocated uint32 arrays
+    and hands the finished frame to the strip in one bulk slice assignment
+    strip is an already constructed PixelStrip (e.g. the headless one) to
+    use instead of creating one from the LED_* settings
+    pipelined=True overlaps composing each frame with sending the last one
+    Returns the Animator that the other anim_* functions use.
     """
-    global _led_count, _gra_data
-    _led_count = led_count
-    _gra_data = [0]*led_count # Maximum segment size
-    
-    global _max_brightness
-    _max_brightness = 0
-
-    global _pat_strip
-    _pat_strip = PixelStrip(led_count, LED_PIN, LED_FREQ_HZ, 
-    LED_DMA, LED_INVERT, _max_brightness, LED_CHANNEL)
-    _pat_strip.begin()
+    global _anim
+    _anim = Animator(led_count, engine, strip, _time, _sleep, pipelined)
+    return _anim
 
-    # Switch off sparkle, fade and spot
-    global _spark_count, _fade_steps_per_repeat, _spot_size
-    _spark_count = 0; _fade_steps_per_repeat = 0; _spot_size = 0
-    
 def anim_stop():
     """
     Called to turn everything off
     """
-    if _pat_strip != None:
-        #~ _pat_strip.getPixels()[:]=[RGB_Black]*_pat_Strip.numPixels()
-        anim_set_max_brightness(0)
-        _pat_strip.show()
-    
-def anim_define_pattern(g_desc, segments=1, seg_reverse=REPEAT, motion=RIGHT, repeat_s=10, reverse=REPEAT):
+    if _anim != None:
+        _anim.stop()
+
+def anim_define_pattern(g_desc, segments=1, seg_reverse=REPEAT, motion=RIGHT, repeat_s=10, reverse=REPEAT, bake=False,
+        transition_s=0, indexed=False, layout=None, along=X_AXIS, positions=0, seg_sizes=None):
     """
-    Set the globals for the main pattern generation. 
+    Set up the main pattern generation.
     Rebuild the gradient and restart the animation.
     g_desc is a gradient descriptor for the main gradient. This is repeated
     in each of the segments (number of segments).
@@ -309,145 +1222,166 @@ def anim_define_pattern(g_desc, segments=1, seg_reverse=REPEAT, motion=RIGHT, re
     motion is LEFT, RIGHT, L2R1 or STOP and reverse says whether the
     gradient movement reverses or repeats when it gets to the end of its
     segment.
+    bake=True precomputes every distinct frame of the pattern now so that
+    rendering is a table lookup; if the table would be bigger than
+    BAKE_MAX_BYTES only the step to pat_ix tables are built.
+    transition_s > 0 (NUMPY engine only) crossfades from the current
+    pattern to this one over that many seconds instead of cutting to it.
+    The new pattern is set up in a background thread meanwhile, so the
+    switch doesn't hold up a frame.
+    indexed=True (NUMPY engine only) composes the pattern as one byte
+    palette indexes and looks the colours up at the end, moving a quarter
+    of the data (see GradientDesc.render_indexed for the limits).
+    layout (a layout.Layout) draws the pattern along a line of positions
+    across the layout instead of along the strip: along is X_AXIS, Y_AXIS,
+    RADIUS or ANGLE and positions how many (0 = one per LED spacing). The
+    segments, motion and spot all work along that line.
+    seg_sizes is a list of segment sizes, used instead of segments for
+    segments of different lengths (e.g. the strips on each controller).
+    The gradient is drawn once at the biggest size and spread over each
+    segment, so they all move together. segment_sizes(LED_COUNT, n)
+    gives n segments with no LEDs left over.
     """
-    global _spot_size
-    _spot_size = 0 # mustn't run spot for previous pattern in case segment size changes
-
-    global _gra_desc
-    _gra_desc = g_desc
-                
-    global _pat_segments, _pat_seg_size, _leds_in_use, _pat_sequential
-    if segments <= 0: # asking all LEDS to change colour together
-        _pat_sequential = False
-        _pat_segments = 1
-    else:
-        _pat_sequential = True
-        _pat_segments = min(segments, _led_count) # can't have segments smaller than one LED
-    _pat_seg_size = _led_count // _pat_segments
-    _set_l2r1_globals()
-    _leds_in_use = _pat_seg_size * _pat_segments
-    
-    global _pat_seg_reverse
-    _pat_seg_reverse = seg_reverse
-
-    global _pat_motion_now, _pat_steps_per_repeat
-    _pat_motion_now = motion
-    # ~ print("DEBUG:animator: motion=",motion,"seg_sz=",_pat_seg_size)
-    if motion == LEFT or motion == RIGHT:
-        _pat_steps_per_repeat = _pat_seg_size
-    elif motion == L2R1:
-        # This is hard because _l2r1_d is not 1 so not every length can be exactly accommodated
-        wholes = _pat_seg_size // _l2r1_d
-        rem = _pat_seg_size % _l2r1_d
-        _pat_steps_per_repeat = _l2r1_t * wholes + rem
-        # ~ print('DEBUG:animator: seg_size',_pat_seg_size, 'steps_per_repeat',_pat_steps_per_repeat)
-    else: # stop
-        _pat_steps_per_repeat = 0;
-
-    global _pat_s_per_step
-    if motion != STOP: _pat_s_per_step = float(repeat_s) / _pat_steps_per_repeat
-    # ~ print("DEBUG:animator: s_per_step=",_pat_s_per_step)
-
-    global _pat_reverse
-    _pat_reverse = reverse
-            
-    # regenerate the gradient
-    global _gra_data
-    _gra_desc.render(_pat_seg_size, _gra_data)
-    
-    # request restart of the animation
-    global _pat_t_start
-    _pat_t_start = 0
-    # ~ print('DEBUG:animator: seg_size',_pat_seg_size,'tot',_pat_seg_size*_pat_segments)
+    _anim.define_pattern(g_desc, segments, seg_reverse, motion, repeat_s, reverse, bake, transition_s, indexed,
+        layout, along, positions, seg_sizes)
 
 def anim_define_spot(s_size, s_colour, s_motion=RIGHT, s_secs=5, s_reverse=REVERSE):
     """
     Define a spot moving on top of the background gradient
     s_size is the size of the spot in 32nds of the segement size.
     The spot is a single colour (s_colour) and can move left, right, 2l1r
-    as defined by s_motion. s_secs is how long the spot takes to move 
-    the length of the segment. When it gets to the end it comes back 
+    as defined by s_motion. s_secs is how long the spot takes to move
+    the length of the segment. When it gets to the end it comes back
     (s_reverse=REVERSE) or starts again (s_reverse=REPEAT)
     """
-    global _spot_size, _spot_steps_per_repeat
-    if s_size <= 0:
-        _spot_size = 0
-    else:
-        _spot_size = max(1, s_size*_pat_seg_size // 32)
-        # ~ print('DEBUG:animator: spot_sz=', _spot_size) 
-        _spot_steps_per_repeat = _pat_seg_size - _spot_size; # Prevent overflow
-            
-    global _spot_colour
-    _spot_colour = s_colour
-    
-    global _spot_motion_now
-    _spot_motion_now = s_motion
-
-    global _spot_s_per_step
-    _spot_s_per_step = float(s_secs) / _pat_seg_size
+    _anim.define_spot(s_size, s_colour, s_motion, s_secs, s_reverse)
 
-    global _spot_reverse
-    _spot_reverse = s_reverse
-    
-    # request restart of the animation
-    global _spot_t_start
-    _spot_t_start = 0
-
-def anim_define_sparkle(s_per_k, s_duration=0.1):
+def anim_define_sparkle(s_per_k, s_duration=0.1, s_colour=RGB_White, s_decay=False, s_seed=None):
     """
     How many sparks (fully lit pixels) per thousand, and how long each should
     be lit before going out.
+    s_colour is the colour of the sparks, or a list of colours to pick from
+    at random for each spark.
+    s_decay=True fades each spark out over its s_duration, and replaces it
+    as it goes out, rather than changing the whole set at once.
+    s_seed seeds the random number generator so a show sparkles the same
+    way every time.
     """
-    global _spark_count
-    _spark_count = s_per_k * _leds_in_use // 1000
-    
-    global _spark_duration
-    _spark_duration = s_duration
+    _anim.define_sparkle(s_per_k, s_duration, s_colour, s_decay, s_seed)
 
-def anim_define_fade(f_secs, f_blend=SMOOTH, f_min=0, f_max=100):
+def anim_define_fade(f_secs, f_blend=SMOOTH, f_min=0, f_max=100, f_layer=False, f_first=0, f_count=0, f_waves=0):
     """
     Fade the whole LED strip in a cycle taking f_secs. The cycle can step
     between f_min and f_max in one go or smoothly linearly interpolated.
     f_min and f_max are in percent of the currently set max_brightness
     which is calculated in _fade_scale
+    f_layer=True (NUMPY engine only) fades the brightness layer instead of
+    the whole strip: just the f_count LEDs from f_first (0 = to the end),
+    in percent of each LED's full brightness. With f_waves the fade is
+    that many cycles out of step from one end of the region to the other,
+    so it travels along it (negative f_waves go the other way).
+    """
+    _anim.define_fade(f_secs, f_blend, f_min, f_max, f_layer, f_first, f_count, f_waves)
+
+def anim_set_brightness_layer(alpha):
     """
-    global _fade_steps_per_repeat
-    if f_secs <= 0: # switch off fading
-        _fade_steps_per_repeat = 0
-        return
-        
-    global _fade_blend
-    _fade_blend = f_blend
-    global _fade_s_per_repeat
-    _fade_s_per_repeat = f_secs
-    _fade_scale(f_min, f_max)
+    Give each LED its own brightness, 0-255, on top of max_brightness
+    (NUMPY engine only). alpha is a value for every LED (or one value for
+    all of them); None switches the layer off.
+    """
+    _anim.set_brightness_layer(alpha)
+
+def anim_set_colour_correction(cc):
+    """
+    Correct the colours sent to the strip (NUMPY engine only): cc is a
+    correction.ColourCorrection with the gamma, white balance and channel
+    calibration for the strip, or None to switch correction off.
+    """
+    _anim.set_colour_correction(cc)
+
+def anim_define_palette_cycle(p_secs, p_mode=ROTATE, p_colours=None):
+    """
+    Animate the colours of an indexed pattern (define_pattern(..., indexed=True))
+    without touching the pattern itself, in a cycle taking p_secs (0 = stop).
+    p_mode ROTATE moves the colours along the palette one entry per step,
+    TWEEN blends the gradient's colours to p_colours (one for each) and back.
+    """
+    _anim.define_palette_cycle(p_secs, p_mode, p_colours)
 
 def anim_set_max_brightness(new_b):
     """
     Set the maximum brightness for the LEDs. As this tweaks the same
-    property of the LED string that fade does, we need to scale the 
+    property of the LED string that fade does, we need to scale the
     values used by fade whenever this changes.
     """
-    global _max_brightness
-    if new_b != _max_brightness:
-        old_b = _max_brightness; _max_brightness = new_b
-        # Re-scale the fade min and max values if fading is going on
-        if _fade_steps_per_repeat != 0:
-            _fade_scale(_fade_min*100/old_b, _fade_max*100/old_b)
-        _pat_strip.setBrightness(_max_brightness)
+    _anim.set_max_brightness(new_b)
+
+def anim_set_clock(clock_time=time, clock_sleep=sleep):
+    """
+    Replace the clock used for animation timing. With a VirtualClock from
+    the headless backend (anim_set_clock(clock.time, clock.sleep)) a show
+    renders as fast as the CPU allows instead of in real time.
+    Call with no arguments to go back to the real clock.
+    """
+    global _time, _sleep
+    _time = clock_time; _sleep = clock_sleep
+    if _anim is not None:
+        _anim.set_clock(clock_time, clock_sleep)
+
+def anim_track_changes(on=True, keepalive_s=1):
+    """
+    Only send frames to the strip when they differ from the last one sent
+    (e.g. motion=STOP or slow moving patterns), resending an unchanged
+    frame every keepalive_s seconds (0 = never)
+    """
+    _anim.track_changes(on, keepalive_s)
+
+def anim_enable_stats(dump_path=None, late_s=0.002):
+    """
+    Start recording per-stage render times, deadline misses (frames starting
+    more than late_s after they were due), skipped pattern steps and the
+    achieved frame rate. If dump_path is given the summary is written
+    there as JSON when the program exits.
+    """
+    _anim.enable_stats(dump_path, late_s)
+
+def anim_disable_stats():
+    _anim.disable_stats()
+
+def anim_get_stats():
+    """
+    Summary of the instrumentation so far (see RenderStats.summary), or
+    None if it isn't switched on
+    """
+    return _anim.get_stats()
+
+def _render_frame():
+    return _anim.render_frame()
 
 def anim_render(stop_time=0):
     """
     Keep transfering the animation to the LEDs until we reach stop_time.
     """
-    while time() < stop_time:
-        t_next = _render_frame()
-        if stop_time != 0: t_next = min(t_next, stop_time)
-        pause = t_next - time()
-        if pause > 0: sleep(pause)
-                
+    _anim.render(stop_time)
+
+def anim_queue(method, *args, **kwargs):
+    """
+    Queue a change to be made between frames while anim_render_async is
+    running. method is the name of the anim_* function without 'anim_',
+    e.g. anim_queue('define_pattern', gradient_preset(3), 2)
+    """
+    _anim.queue(method, *args, **kwargs)
+
+async def anim_render_async(stop_time=0):
+    """
+    asyncio version of anim_render: other coroutines (e.g. a web or MQTT
+    controller calling anim_queue) run while we wait between frames
+    """
+    await _anim.render_async(stop_time)
+
 if __name__ == "__main__":
-    anim_init(150, 200)
+    anim_init(150)
+    anim_set_max_brightness(200)
     anim_define_pattern(gradient_preset(6), 1, seg_reverse=REPEAT, motion=LEFT, repeat_s=5, reverse=REPEAT)
     anim_define_spot(s_size=3, s_colour=0x00FF00, s_motion=RIGHT, s_secs=5, s_reverse=REVERSE)
     anim_define_sparkle(s_per_k=10, s_duration=0.1)
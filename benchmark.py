@@ -0,0 +1,159 @@
+# Benchmark the animator and gradient renderers.
+# Runs against the headless backend with a virtual clock so it works on
+# any machine and measures only our own code (plus the copy into the
+# strip's ring buffer). Results are written as JSON so that two runs
+# (e.g. before and after a change) can be compared with --compare.
+#
+#   python3 benchmark.py --quick --output before.json
+#   ... change things ...
+#   python3 benchmark.py --quick --compare before.json
+import sys, os, json, argparse, platform, tracemalloc
+from time import perf_counter
+sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/rpi-ws281x-simulator')
+import animator
+from rpi_ws281x_headless import PixelStrip, VirtualClock
+import gradients
+from gradients import gradient_preset, SMOOTH, STEP
+from colours import *
+
+LED_COUNTS = (150, 600, 2000, 10000)
+SEGMENTS = (1, 4)
+MOTIONS = {'STOP': animator.STOP, 'RIGHT': animator.RIGHT, 'LEFT': animator.LEFT, 'L2R1': animator.L2R1}
+OVERLAYS = ('none', 'spot', 'sparkle', 'fade')
+ENGINES = {'LISTS': animator.LISTS, 'NUMPY': animator.NUMPY}
+PRESETS = range(1, 9)
+FRAME_S = 0.01 # virtual time between frames, fast enough for every step to move
+
+def _setup(led_count, engine, segments, motion, overlay, preset=5):
+    clock = VirtualClock()
+    animator.anim_set_clock(clock.time, clock.sleep)
+    strip = PixelStrip(led_count, ring_frames=1)
+    animator.anim_init(led_count, engine, strip=strip)
+    animator.anim_set_max_brightness(255)
+    animator.anim_define_pattern(gradient_preset(preset, SMOOTH), segments, motion=motion, repeat_s=5)
+    if overlay == 'spot':
+        animator.anim_define_spot(s_size=3, s_colour=RGB_Green)
+    elif overlay == 'sparkle':
+        animator.anim_define_sparkle(s_per_k=50, s_duration=FRAME_S)
+    elif overlay == 'fade':
+        animator.anim_define_fade(f_secs=2, f_min=20)
+    return clock, strip
+
+def bench_render(led_count, engine, segments, motion, overlay, frames):
+    """Time render_frame for one configuration"""
+    clock, strip = _setup(led_count, engine, segments, motion, overlay)
+    anim = animator._anim
+    anim.render_frame() # warm up
+    t0 = perf_counter()
+    for i in range(frames):
+        clock.sleep(FRAME_S)
+        anim.render_frame()
+    elapsed = perf_counter() - t0
+    # per-stage timings from a separate run, as the instrumentation
+    # costs more than some of the stages it times
+    anim.enable_stats()
+    for i in range(frames):
+        clock.sleep(FRAME_S)
+        anim.render_frame()
+    stats = anim.get_stats()
+    anim.disable_stats()
+    # Allocations: peak extra memory while rendering a frame
+    tracemalloc.start()
+    peak = 0
+    for i in range(min(frames, 10)):
+        clock.sleep(FRAME_S)
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        anim.render_frame()
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {'fps': frames / elapsed, 'us_per_frame': 1e6 * elapsed / frames,
+        'stage_us': {name: st['mean_us'] for name, st in stats['stages'].items()},
+        'alloc_bytes_per_frame': peak // min(frames, 10)}
+
+def bench_gradients(sizes, repeat):
+    """Time rendering each preset, cold (cache cleared) and cached"""
+    results = {}
+    for preset in PRESETS:
+        for blend, blend_name in ((STEP, 'STEP'), (SMOOTH, 'SMOOTH')):
+            for size in sizes:
+                g = gradient_preset(preset, blend)
+                out = [0] * size
+                t_cold = 0.0
+                for i in range(repeat):
+                    gradients._render_cached.cache_clear()
+                    t0 = perf_counter(); g.render(size, out); t_cold += perf_counter() - t0
+                t0 = perf_counter()
+                for i in range(repeat): g.render(size, out)
+                t_warm = perf_counter() - t0
+                results['preset{0}/{1}/{2}'.format(preset, blend_name, size)] = {
+                    'us_cold': 1e6 * t_cold / repeat, 'us_cached': 1e6 * t_warm / repeat}
+    return results
+
+def bench_define_pattern(sizes, repeat):
+    """Time anim_define_pattern, which is what a show does on every change"""
+    results = {}
+    for engine_name, engine in ENGINES.items():
+        for size in sizes:
+            _setup(size, engine, 1, animator.RIGHT, 'none')
+            for bake in (False, True):
+                t0 = perf_counter()
+                for i in range(repeat):
+                    gradients._render_cached.cache_clear()
+                    animator.anim_define_pattern(gradient_preset(1 + i % 8, SMOOTH), 4, motion=animator.L2R1, bake=bake)
+                results['{0}/{1}/{2}'.format(engine_name, size, 'baked' if bake else 'live')] = {
+                    'us': 1e6 * (perf_counter() - t0) / repeat}
+    return results
+
+def run(quick=False):
+    led_counts = LED_COUNTS[:2] if quick else LED_COUNTS
+    frames = 20 if quick else 100
+    render = {}
+    for engine_name, engine in ENGINES.items():
+        for led_count in led_counts:
+            for segments in SEGMENTS:
+                for motion_name, motion in MOTIONS.items():
+                    for overlay in OVERLAYS:
+                        key = '{0}/{1}/seg{2}/{3}/{4}'.format(engine_name, led_count, segments, motion_name, overlay)
+                        render[key] = bench_render(led_count, engine, segments, motion, overlay, frames)
+                        print('{0:40s} {1:10.1f} fps'.format(key, render[key]['fps']), file=sys.stderr)
+    return {
+        'python': platform.python_version(), 'machine': platform.machine(),
+        'render': render,
+        'gradients': bench_gradients(led_counts, 3 if quick else 10),
+        'define_pattern': bench_define_pattern(led_counts, 3 if quick else 10),
+    }
+
+def compare(old, new, tolerance):
+    """
+    Return a list of (key, old fps, new fps) for render configurations that
+    got more than tolerance (fraction) slower
+    """
+    slower = []
+    for key, res in new['render'].items():
+        if key in old['render']:
+            old_fps = old['render'][key]['fps']
+            if res['fps'] < old_fps * (1 - tolerance):
+                slower.append((key, old_fps, res['fps']))
+    return slower
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the animator render loop and gradient generation')
+    parser.add_argument('--quick', action='store_true', help='fewer LED counts and frames')
+    parser.add_argument('--output', help='write the JSON results here (default stdout)')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before a regression is reported (default 0.2)')
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(json.load(f), results, args.tolerance)
+        for key, old_fps, new_fps in slower:
+            print('REGRESSION {0}: {1:.1f} -> {2:.1f} fps'.format(key, old_fps, new_fps), file=sys.stderr)
+        sys.exit(1 if slower else 0)
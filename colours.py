@@ -3,10 +3,13 @@ try:
 except:
     import os; import sys
     sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/rpi-ws281x-simulator')
-    from rpi_ws281x_simulator import Color
+    try:
+        from rpi_ws281x_simulator import Color
+    except ImportError:
+        from rpi_ws281x_headless import Color
 # Some pre-calculated primary colours for use around the place (Color is defined in neopixels)
 RGB_Red=Color(255,0,0); RGB_Green=Color(0,255,0); RGB_Blue=Color(0,0,255)
 RGB_Orange=Color(255,128,0)
 RGB_Yellow=Color(255,255,0); RGB_Cyan=Color(0,255,255); RGB_Magenta=Color(255,0,255)
 RGB_Black=Color(0,0,0); RGB_Grey=Color(85,85,85); RGB_White=Color(255,255,255)
-RGB_W_bal=Color(240,240,240) # looks as bright as a pure colour
+RGB_W_bal=Color(240,240,240) # looks as bright as a pure colour (correction.ColourCorrection balances a whole strip)
@@ -0,0 +1,53 @@
+# Colour correction: gamma, white balance and per channel calibration as
+# 256 entry lookup tables.
+# Gamma is non-linear so it has to come after the brightness scaling, which
+# the strip does as it sends each frame: the gamma table is given to the
+# strip (PixelStrip(..., gamma=gamma_table(2.8)) or strip.setGamma) and the
+# driver applies it in C; the simulators do the same. White balance and
+# calibration are per channel, so the animator applies them to the composed
+# frame, every byte of every LED looked up in one go (NUMPY engine).
+import sys
+import numpy
+
+def gamma_table(gamma=2.8, max_out=255):
+    """
+    256 entry gamma correction table, as a list for PixelStrip and setGamma
+    """
+    return [int(round(((i / 255) ** gamma) * max_out)) for i in range(256)]
+
+class ColourCorrection:
+    """
+    gamma - gamma for the strip to apply (None = leave the strip's alone)
+    white - the colour that looks white on this strip: each channel is
+            scaled by white/255 (e.g. (255, 200, 180) for a blue-ish strip)
+    red, green, blue - optional 256 entry calibration tables for each
+            channel, looked up after the white balance
+    """
+    def __init__(self, gamma=None, white=(255, 255, 255), red=None, green=None, blue=None):
+        self.gamma = gamma
+        self.white = white
+        ramp = numpy.arange(256)
+        tables = numpy.empty((4, 256), numpy.uint8) # one per byte of a colour, lowest first
+        for byte, (w, cal) in enumerate(((white[2], blue), (white[1], green), (white[0], red))):
+            table = (ramp * w + 127) // 255
+            if cal is not None:
+                table = numpy.asarray(cal)[table]
+            tables[byte] = table
+        tables[3] = ramp # white LED of RGBW strips left as it is
+        if sys.byteorder == 'big':
+            tables = tables[::-1]
+        self.tables = tables
+        self._lut = tables.ravel()
+        self._offsets = numpy.arange(4, dtype=numpy.uint16) * 256 # start of each byte's table
+
+    def gamma_table(self):
+        """The table for the strip, None if gamma is left alone"""
+        return gamma_table(self.gamma) if self.gamma is not None else None
+
+    def apply(self, in_bytes, out_bytes, ix):
+        """
+        Correct the colours in in_bytes (LEDs, 4) uint8 into out_bytes (may
+        be the same array). ix is a (LEDs, 4) uint16 scratch array.
+        """
+        numpy.add(in_bytes, self._offsets, out=ix, dtype=numpy.uint16)
+        numpy.take(self._lut, ix, out=out_bytes)
@@ -2,6 +2,8 @@
 # Author: Tony DiCola (tony@tonydicola.com), Jeremy Garff (jer@jers.net)
 import _rpi_ws281x as ws
 import atexit
+import ctypes
+import numpy
 
 
 #try:
@@ -45,6 +47,10 @@ class _LED_Data(object):
         # Handle if a slice of positions are passed in by setting the appropriate
         # LED data values to the provided values.
         if isinstance(pos, slice):
+            # A contiguous run of 32 bit values (array('I'), numpy uint32,
+            # memoryview) is copied into the channel in a single memmove.
+            if self._set_bulk(pos, value):
+                return
             index = 0
             for n in range(*pos.indices(self.size)):
                 ws.ws2811_led_set(self.channel, n, value[index])
@@ -53,6 +59,35 @@ class _LED_Data(object):
         else:
             return ws.ws2811_led_set(self.channel, int(pos), value)
 
+    def _set_bulk(self, pos, value):
+        """Copy value into the slice pos with one memmove if value is a
+        C-contiguous buffer (read-only is fine) of unsigned 32 bit integers
+        and pos has a step of 1 (any other type, e.g. float32 or int32,
+        would be copied as raw bits).
+        Return False (having done nothing) if the caller should fall back to
+        setting the LEDs one at a time.
+        """
+        if isinstance(value, (list, tuple)):
+            return False
+        start, stop, step = pos.indices(self.size)
+        if step != 1:
+            return False
+        try:
+            buf = memoryview(value)
+        except TypeError:
+            return False
+        if (buf.itemsize != 4 or buf.format not in ('I', '@I', '=I', '<I', 'L', '@L', '=L', '<L')
+                or not buf.c_contiguous):
+            return False
+        count = max(0, stop - start)
+        if buf.nbytes < count * 4:
+            raise ValueError('buffer has {0} values, slice needs {1}'.format(buf.nbytes // 4, count))
+        if count > 0:
+            leds = int(ws.ws2811_channel_t_leds_get(self.channel))
+            src = numpy.frombuffer(buf, numpy.uint8).ctypes.data # only read, so no write access needed
+            ctypes.memmove(leds + start * 4, src, count * 4)
+        return True
+
 
 class PixelStrip(object):
     def __init__(self, num, pin, freq_hz=800000, dma=10, invert=False,
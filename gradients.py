@@ -1,10 +1,15 @@
 import time
 import sys
+from functools import lru_cache
+import numpy
 try:
     from rpi_ws281x import Color
 except:
     import os; sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/rpi-ws281x-simulator')
-    from rpi_ws281x_simulator import Color
+    try:
+        from rpi_ws281x_simulator import Color
+    except ImportError:
+        from rpi_ws281x_headless import Color
 from colours import *
 # How it works overview:
 # The gradient description is used to 
@@ -16,6 +21,9 @@ from colours import *
 
 # Blend values
 SMOOTH=1; STEP=2; DASH=3; DOT=4
+# Palette indexed gradients: the gradient uses palette entries 0 to PAL_SIZE-1,
+# the last two are kept for black (the bars and any LEDs left over) and the spot
+PAL_SIZE = 254; PAL_BLACK = 254; PAL_SPOT = 255
 
 def _hue(pos):
     """Generate rainbow colors across 0-255 positions."""
@@ -54,62 +62,180 @@ class GradientDesc:
         self.bar_on = bar_on
         self.bar_off = bar_off
 
+    def _key(self, size):
+        return (tuple(self.colours), self.repeats, self.blend, self.bar_on, self.bar_off, size)
+
     def render(self, size, out_data):
         """
         Compute 'size' (number) of individual colours for the current 
         gradient and put the computed colours into the supplied list
-        The way colour points are treated is different between STEP and
-        SMOOTH. E.g. two colour points, white and black. For a STEP you
-        expect white to 50%, then black to 100%. For a SMOOTH you expect 
-        a blend from white at 0 to black at 100%. This can be achieved 
-        by pretending we have one fewer colour point when using SMOOTH
-        For repeats: split the size into equal parts. Fill the first
-        part then copy to the others. If the size isn't divisible exactly
-        then round up for the first part and copy to n*size/repeats which
-        will periodically overwrite the last bit
+        (or numpy array). The work is done by render_array so repeated
+        renders of the same gradient come from the cache.
         """
-        # calculate the max size of each of the repeats in the gradient
-        part_sz = (size+self.repeats-1)//self.repeats
-        # ~ print("DEBUG:gradients: gradient part_sz=",part_sz)
-        # fill in the first part
-        if self.blend != SMOOTH: # simple case
-            ncols = len(self.colours)
-            for i in range(part_sz):
-              out_data[i] = self.colours[ncols*i//part_sz]
+        if size <= 0:
+            return
+        data = self.render_array(size)
+        if isinstance(out_data, numpy.ndarray):
+            out_data[0:size] = data
         else:
-            ncols = len(self.colours) - 1 # last colour is reserved for final data point
-            out_data[part_sz-1] = self.colours[ncols] # put the last colour in
-            smooth_sz = part_sz - 1 # we're working with this part now
+            out_data[0:size] = data.tolist()
+
+    def render_array(self, size):
+        """
+        Return the rendered gradient as a read-only numpy uint32 array of
+        length 'size'. Results are kept in an LRU cache keyed on everything
+        that affects the output, so switching back to a gradient that has
+        been used recently costs nothing.
+        """
+        return _render_cached(*self._key(size))
+
+    def render_indexed(self, size):
+        """
+        Return the gradient as a read-only uint8 array of indexes into
+        palette(), cached like render_array. Only the geometry is cached,
+        so changing the colours (same number of them) just needs a new
+        palette. STEP gradients come out exactly; SMOOTH ones are limited
+        to PAL_SIZE colours, so very long blends show some banding.
+        """
+        _check_palette_size(self.colours)
+        return _render_indexed_cached(len(self.colours), self.repeats, self.blend, self.bar_on, self.bar_off, size)
+
+    def palette_size(self):
+        """How many palette entries render_indexed uses (from 0)"""
+        n = len(self.colours)
+        if self.blend != SMOOTH or n < 2:
+            return n
+        return (n-1) * _smooth_levels(n-1) + 1
+
+    def palette(self, colours=None):
+        """
+        The 256 colour palette for render_indexed: built from colours, or
+        this gradient's own colours if not given. Entry PAL_SPOT is black.
+        """
+        colours = self.colours if colours is None else colours
+        _check_palette_size(colours)
+        return _palette(colours, self.blend)
+
+def _check_palette_size(colours):
+    if len(colours) > PAL_SIZE:
+        raise ValueError('a palette can hold {0} colours, not {1}'.format(PAL_SIZE, len(colours)))
+
+def _smooth_levels(ncols):
+    """How many palette entries each pair of colours in a SMOOTH gradient gets"""
+    return (PAL_SIZE - 1) // ncols
+
+def _palette(colours, blend):
+    pal = numpy.zeros(256, numpy.uint32) # PAL_BLACK and PAL_SPOT start black
+    cols = numpy.array(colours, numpy.int64)
+    if blend != SMOOTH or len(cols) < 2:
+        pal[0:len(cols)] = cols
+        return pal
+    ncols = len(cols) - 1
+    levels = _smooth_levels(ncols)
+    frac = numpy.arange(levels) / levels
+    colour1 = cols[:-1, None]; colour2 = cols[1:, None]
+    out = numpy.zeros((ncols, levels), numpy.int64)
+    for shift, mask in ((16, -1), (8, 0xFF), (0, 0xFF)): # same blend as _render_cached
+        c1 = (colour1 >> shift) & mask
+        c2 = (colour2 >> shift) & mask
+        out |= ((1-frac)*c1 + frac*c2).astype(numpy.int64) << shift
+    pal[0:ncols*levels] = out.ravel()
+    pal[ncols*levels] = cols[ncols] # the last colour
+    return pal
+
+@lru_cache(maxsize=32)
+def _render_indexed_cached(n_colours, repeats, blend, bar_on, bar_off, size):
+    """
+    Same layout as _render_cached, but each entry is the palette index
+    of the colour rather than the colour itself
+    """
+    out_data = numpy.zeros(size, numpy.uint8)
+    part_sz = (size+repeats-1)//repeats
+    i = numpy.arange(part_sz, dtype=numpy.int64)
+    if blend != SMOOTH or n_colours < 2:
+        out_data[0:part_sz] = n_colours*i//part_sz
+    else:
+        ncols = n_colours - 1
+        levels = _smooth_levels(ncols)
+        out_data[part_sz-1] = ncols*levels # the last colour
+        smooth_sz = part_sz - 1
+        if smooth_sz > 0:
+            i_per_c = smooth_sz / ncols
+            i = i[:smooth_sz]
+            this_c = ncols*i//smooth_sz
+            cur_ci = (this_c*smooth_sz + ncols-1)//ncols
+            frac = (i-cur_ci) / i_per_c
+            out_data[0:smooth_sz] = this_c*levels + numpy.minimum(levels, numpy.rint(frac*levels).astype(numpy.int64))
+    for part in range(repeats-1,0,-1):
+        i = size * part//repeats
+        out_data[i:i+part_sz]=out_data[0:part_sz]
+    if bar_on > 0:
+        d_sz = max(1, size // 75)
+        on_sz = bar_on * d_sz
+        period = on_sz + bar_off * d_sz
+        bars = max(0, (size - on_sz + period - 1) // period)
+        tail = min(size, bars * period)
+        out_data[0:tail][numpy.arange(tail) % period < on_sz] = PAL_BLACK
+        out_data[tail:size] = PAL_BLACK
+    out_data.flags.writeable = False
+    return out_data
+
+@lru_cache(maxsize=32)
+def _render_cached(colours, repeats, blend, bar_on, bar_off, size):
+    """
+    Vectorised gradient renderer, see GradientDesc for the parameters.
+    The way colour points are treated is different between STEP and
+    SMOOTH. E.g. two colour points, white and black. For a STEP you
+    expect white to 50%, then black to 100%. For a SMOOTH you expect 
+    a blend from white at 0 to black at 100%. This can be achieved 
+    by pretending we have one fewer colour point when using SMOOTH
+    For repeats: split the size into equal parts. Fill the first
+    part then copy to the others. If the size isn't divisible exactly
+    then round up for the first part and copy to n*size/repeats which
+    will periodically overwrite the last bit
+    """
+    out_data = numpy.zeros(size, numpy.uint32)
+    cols = numpy.array(colours, numpy.int64)
+    # calculate the max size of each of the repeats in the gradient
+    part_sz = (size+repeats-1)//repeats
+    # fill in the first part
+    i = numpy.arange(part_sz, dtype=numpy.int64)
+    if blend != SMOOTH: # simple case, DASH and DOT are treated as STEP
+        ncols = len(cols)
+        out_data[0:part_sz] = cols[ncols*i//part_sz]
+    else:
+        ncols = len(cols) - 1 # last colour is reserved for final data point
+        out_data[part_sz-1] = cols[ncols] # put the last colour in
+        smooth_sz = part_sz - 1 # we're working with this part now
+        if smooth_sz > 0:
             i_per_c = smooth_sz / ncols # how many entries in the gradient for each defined colour
-            cur_c = -1
-            for i in range(smooth_sz):
-                this_c = int(ncols * i // smooth_sz)
-                if this_c != cur_c:
-                    cur_c = this_c
-                    cur_ci = i
-                    colour1 = self.colours[this_c]
-                    colour2 = self.colours[this_c + 1]
-                out_data[i] = _interp(colour1, colour2, (i-cur_ci) / i_per_c)
-                # ~ print(i,ncols,this_c,'DEBUG:gradients: colour1 {0:#08x}, colour2 {1:#08x}, ipercol:{2:1.2f} ithisc:{3:d} res:{4:#08x} prop:{5:1.2f}'.format(colour1,colour2,i_per_c,cur_ci,out_data[i],float(i-cur_ci) / i_per_c))
-        # ~ print('DEBUG:gradients: part_sz=', part_sz, ' out_data=', out_data)
-        # Copy to other parts. Start at the top to avoid overwriting the master copy
-        for part in range(self.repeats-1,0,-1): 
-            i = size * part//self.repeats
-            out_data[i:i+part_sz]=out_data[0:part_sz]
-        # put in the black bars
-        if self.bar_on > 0:
-            d_sz = max(1, size // 75)
-            on_sz = self.bar_on * d_sz
-            off_sz = self.bar_off * d_sz
-            bar = [RGB_Black] * on_sz
-            i = 0
-            while i + on_sz < size:
-                out_data[i:i+on_sz] = bar
-                i += on_sz+off_sz
-            while i < size:
-                out_data[i:i+1]=[RGB_Black]
-                i += 1
-            
+            i = i[:smooth_sz]
+            this_c = ncols*i//smooth_sz
+            cur_ci = (this_c*smooth_sz + ncols-1)//ncols # first entry using this_c
+            frac = (i-cur_ci) / i_per_c
+            colour1 = cols[this_c]
+            colour2 = cols[this_c + 1]
+            out = numpy.zeros(smooth_sz, numpy.int64)
+            for shift, mask in ((16, -1), (8, 0xFF), (0, 0xFF)): # red isn't masked, as in _colour_to_tuple
+                c1 = (colour1 >> shift) & mask
+                c2 = (colour2 >> shift) & mask
+                out |= ((1-frac)*c1 + frac*c2).astype(numpy.int64) << shift
+            out_data[0:smooth_sz] = out
+    # Copy to other parts. Start at the top to avoid overwriting the master copy
+    for part in range(repeats-1,0,-1): 
+        i = size * part//repeats
+        out_data[i:i+part_sz]=out_data[0:part_sz]
+    # put in the black bars: bar_on, bar_off pattern then black to the end
+    if bar_on > 0:
+        d_sz = max(1, size // 75)
+        on_sz = bar_on * d_sz
+        period = on_sz + bar_off * d_sz
+        bars = max(0, (size - on_sz + period - 1) // period)
+        tail = min(size, bars * period)
+        out_data[0:tail][numpy.arange(tail) % period < on_sz] = RGB_Black
+        out_data[tail:size] = RGB_Black
+    out_data.flags.writeable = False
+    return out_data
 
 def gradient_preset(preset, blend=STEP, bar_on=0, bar_off=2):
     """Some presets for quick setup of gradient descriptor"""
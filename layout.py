@@ -0,0 +1,127 @@
+# LED layouts: where each LED of a strip actually is.
+# A Layout holds the x, y position of every LED (in LED spacings, y down as
+# on the screen), made by one of the functions below: a matrix (serpentine
+# or not), a polyline (the strip laid along a path of straight runs) or a
+# STRIPS_DEF style list of straight strips.
+# The animator still draws a pattern along a line of positions, the same
+# way it draws a segment. Layout.positions says which position along an axis
+# (or out from the centre, or round it) each LED is at, so the 2D picture is
+# that line gathered through the table: one numpy.take per frame. Tables
+# are worked out once per layout, axis and size and kept.
+import math
+import numpy
+
+# What positions are measured along
+X_AXIS=0; Y_AXIS=1; RADIUS=2; ANGLE=3
+
+class Layout:
+    """
+    x and y of every LED of a strip, LED i at (x[i], y[i]). centre is
+    where RADIUS and ANGLE are measured from (default: the middle of
+    the layout).
+    """
+    def __init__(self, x, y, centre=None):
+        self.x = numpy.array(x, float)
+        self.y = numpy.array(y, float)
+        if self.x.shape != self.y.shape or self.x.ndim != 1:
+            raise ValueError('x and y must be the same length')
+        if centre is None and len(self.x):
+            centre = ((self.x.min() + self.x.max()) / 2, (self.y.min() + self.y.max()) / 2)
+        self.centre = centre or (0, 0)
+        self._tables = {}       # (along, size) -> positions
+
+    def __len__(self):
+        return len(self.x)
+
+    def coordinate(self, along):
+        """Where each LED is along X_AXIS, Y_AXIS, RADIUS or ANGLE (radians)"""
+        if along == X_AXIS:
+            return self.x
+        if along == Y_AXIS:
+            return self.y
+        dx = self.x - self.centre[0]; dy = self.y - self.centre[1]
+        if along == RADIUS:
+            return numpy.hypot(dx, dy)
+        if along == ANGLE:
+            return numpy.arctan2(dy, dx)
+        raise ValueError('unknown axis {0}'.format(along))
+
+    def size(self, along):
+        """
+        Natural number of positions along an axis: one per LED spacing
+        (round the outside for ANGLE)
+        """
+        if len(self) == 0:
+            return 1
+        if along == ANGLE:
+            return max(8, int(round(math.tau * self.coordinate(RADIUS).max())))
+        v = self.coordinate(along)
+        return int(round(v.max() - v.min())) + 1
+
+    def positions(self, along=X_AXIS, size=0):
+        """
+        Table of which of size positions (0 = the natural size) along an
+        axis each LED is at, as a read-only numpy intp array
+        """
+        if size <= 0:
+            size = self.size(along)
+        key = (along, size)
+        table = self._tables.get(key)
+        if table is None:
+            v = self.coordinate(along)
+            if along == ANGLE: # goes all the way round, so -pi and pi are the same place
+                table = numpy.floor((v + math.pi) * size / math.tau).astype(numpy.intp) % size
+            elif len(v) and v.max() > v.min():
+                lo = v.min()
+                table = numpy.rint((v - lo) * (size-1) / (v.max() - lo)).astype(numpy.intp)
+            else:
+                table = numpy.zeros(len(v), numpy.intp)
+            table.setflags(write=False)
+            self._tables[key] = table
+        return table
+
+def matrix(width, height, serpentine=True, by_columns=False):
+    """
+    A width x height matrix wired along each row in turn from the top left
+    (by_columns: down each column). serpentine: every other row (column)
+    runs back the other way, as most ready made panels are wired.
+    """
+    i = numpy.arange(width * height)
+    run = height if by_columns else width
+    along = i % run; across = i // run
+    if serpentine:
+        along = numpy.where(across % 2 == 1, run - 1 - along, along)
+    return Layout(across, along) if by_columns else Layout(along, across)
+
+def polyline(points, counts, closed=False):
+    """
+    A strip laid along the path through points: counts[i] LEDs evenly
+    spaced from points[i] towards points[i+1] (the next run starts at
+    its end). closed: there's one more run, from the last point back to
+    the first, for a strip wrapped round a shape.
+    """
+    points = [tuple(p) for p in points]
+    if closed:
+        points.append(points[0])
+    if len(counts) != len(points) - 1:
+        raise ValueError('need a count for each of the {0} runs'.format(len(points) - 1))
+    xs = []; ys = []
+    for (x0, y0), (x1, y1), count in zip(points, points[1:], counts):
+        f = numpy.arange(count) / count
+        xs.append(x0 + (x1 - x0) * f); ys.append(y0 + (y1 - y0) * f)
+    if not xs:
+        return Layout([], [])
+    return Layout(numpy.concatenate(xs), numpy.concatenate(ys))
+
+def strips(strips_def):
+    """
+    Straight strips, one after another: (number of LEDs, x, y, x step, y
+    step) for each, as the simulator's STRIPS_DEF
+    """
+    xs = []; ys = []
+    for count, x0, y0, xm, ym in strips_def:
+        i = numpy.arange(count)
+        xs.append(x0 + xm*i); ys.append(y0 + ym*i)
+    if not xs:
+        return Layout([], [])
+    return Layout(numpy.concatenate(xs), numpy.concatenate(ys))
@@ -0,0 +1,68 @@
+# One long strip made of several: for installations spread over more than
+# one controller (PWM channels, other boards, network controllers), each
+# driving its own run of LEDs.
+# MultiStrip looks like a single PixelStrip to the animator, which composes
+# the whole strip in one buffer as usual. show() then streams it out a chunk
+# at a time: each sink gets its own run of LEDs, a slice of the buffer
+# copied straight into it, and is shown. Nothing is held per sink beyond
+# the sink itself, so memory is one frame whatever the number of LEDs.
+import numpy
+
+class MultiStrip:
+    """
+    sinks are PixelStrip-like objects (real, simulated, headless, network)
+    in the order their LEDs come along the whole strip: the first
+    sinks[0].numPixels() LEDs go to sinks[0], the next ones to sinks[1]
+    and so on.
+    """
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self._runs = [] # (sink, first LED, LED count)
+        n = 0
+        for sink in self.sinks:
+            count = sink.numPixels()
+            self._runs.append((sink, n, count))
+            n += count
+        self._n = n
+        self._pixels = numpy.zeros(n, numpy.uint32)
+        self._pixels_out = memoryview(self._pixels)
+        self._brightness = 0
+
+    def begin(self):
+        for sink in self.sinks:
+            sink.begin()
+
+    def show(self):
+        out = self._pixels_out
+        for sink, first, count in self._runs:
+            sink.setBrightness(self._brightness)
+            sink.getPixels()[0:count] = out[first:first+count]
+            sink.show()
+
+    def finish(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'finish'):
+                sink.finish()
+
+    def setBrightness(self, brightness):
+        self._brightness = brightness
+
+    def getBrightness(self):
+        return self._brightness
+
+    def setGamma(self, gamma):
+        for sink in self.sinks:
+            if hasattr(sink, 'setGamma'):
+                sink.setGamma(gamma)
+
+    def getPixels(self):
+        return self._pixels
+
+    def numPixels(self):
+        return self._n
+
+    def setPixelColor(self, n, colour):
+        self._pixels[n] = colour
+
+    def getPixelColor(self, n):
+        return int(self._pixels[n])
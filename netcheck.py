@@ -0,0 +1,82 @@
+# Loopback check of the network output strip.
+# Binds a UDP socket on 127.0.0.1, points a NetworkStrip at it and checks
+# the E1.31 and Art-Net packets that arrive: header fields, lengths,
+# universe numbering, sequence numbers and the channel data.
+#
+#   python3 netcheck.py
+import socket
+from netstrip import NetworkStrip, E131, ARTNET
+
+LEDS = 400 # three universes: 170 + 170 + 60 LEDs
+
+def _receive(sock, count):
+    packets = []
+    for i in range(count):
+        data, address = sock.recvfrom(1024)
+        packets.append(data)
+    return packets
+
+def _frame(strip):
+    """Send a frame whose channel bytes can be worked out from the LED index"""
+    for i in range(LEDS):
+        strip.setPixelColorRGB(i, i % 256, (i * 3) % 256, (i * 7) % 256)
+    strip.show()
+
+def _expected(first, used, order):
+    """The channel bytes of LEDs first to first+used in this channel order"""
+    out = bytearray()
+    for i in range(first, first + used):
+        rgb = {'R': i % 256, 'G': (i * 3) % 256, 'B': (i * 7) % 256}
+        out += bytes(rgb[c] for c in order)
+    return bytes(out)
+
+def check(protocol, order='RGB', universe=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2)
+    strip = NetworkStrip(LEDS, host='127.0.0.1', protocol=protocol, universe=universe,
+        port=sock.getsockname()[1], order=order)
+    first_universe = universe if universe is not None else (1 if protocol == E131 else 0)
+    try:
+        assert strip.universes() == 3, strip.universes()
+        for frame in (1, 2):
+            _frame(strip)
+            packets = _receive(sock, strip.universes())
+            for i, packet in enumerate(packets):
+                used = min(170, LEDS - i * 170)
+                data = _expected(i * 170, used, order)
+                if protocol == E131:
+                    assert packet[0:16] == b'\x00\x10\x00\x00ASC-E1.17\x00\x00\x00'
+                    assert len(packet) == 126 + len(data)
+                    assert int.from_bytes(packet[16:18], 'big') == 0x7000 | (len(packet) - 16)
+                    assert int.from_bytes(packet[18:22], 'big') == 4
+                    assert int.from_bytes(packet[38:40], 'big') == 0x7000 | (len(packet) - 38)
+                    assert int.from_bytes(packet[40:44], 'big') == 2
+                    assert packet[108] == 100
+                    assert packet[111] == frame
+                    assert int.from_bytes(packet[113:115], 'big') == first_universe + i
+                    assert int.from_bytes(packet[115:117], 'big') == 0x7000 | (len(packet) - 115)
+                    assert packet[117] == 2 and packet[118] == 0xa1
+                    assert int.from_bytes(packet[123:125], 'big') == len(data) + 1
+                    assert packet[125] == 0 # DMX start code
+                    assert packet[126:] == data
+                else:
+                    length = len(data) + len(data) % 2
+                    assert packet[0:8] == b'Art-Net\x00'
+                    assert int.from_bytes(packet[8:10], 'little') == 0x5000
+                    assert int.from_bytes(packet[10:12], 'big') == 14
+                    assert packet[12] == frame
+                    assert int.from_bytes(packet[14:16], 'little') == first_universe + i
+                    assert int.from_bytes(packet[16:18], 'big') == length
+                    assert len(packet) == 18 + length
+                    assert packet[18:18+len(data)] == data
+    finally:
+        strip.finish()
+        sock.close()
+
+if __name__ == "__main__":
+    check(E131)
+    check(E131, order='GRB', universe=10)
+    check(ARTNET)
+    check(ARTNET, order='BGR', universe=5)
+    print('E1.31 and Art-Net packets OK')
@@ -0,0 +1,167 @@
+# Network output: drives pixel controllers over UDP with E1.31 (sACN) or
+# Art-Net instead of a locally attached strip.
+# NetworkStrip looks like a PixelStrip to the animator. The LEDs are split
+# into DMX universes of up to 512 channels (170 RGB pixels by default) and
+# each universe is one UDP packet. All the packets are built once, headers
+# and all, in a single preallocated buffer; show() only writes the pixel
+# channels and sequence numbers into it, a couple of numpy lookups for the
+# whole strip, and sends each packet straight from its slice of the buffer.
+# Several controllers: one NetworkStrip each, joined with multistrip.MultiStrip.
+import sys, socket, uuid
+import numpy
+
+# Protocols
+E131=1; ARTNET=2
+E131_PORT = 5568
+ARTNET_PORT = 6454
+DMX_CHANNELS = 512
+
+# E1.31 data packet: root, framing and DMP layers then the DMX data
+_E131_HEADER = 126
+_E131_SEQ = 111
+# Art-Net ArtDmx packet
+_ARTNET_HEADER = 18
+_ARTNET_SEQ = 12
+
+def _e131_header(packet, cid, source, universe, channels, priority):
+    length = _E131_HEADER + channels
+    packet[0:16] = b'\x00\x10\x00\x00ASC-E1.17\x00\x00\x00'
+    packet[16:18] = (0x7000 | (length - 16)).to_bytes(2, 'big')
+    packet[18:22] = (4).to_bytes(4, 'big')                 # VECTOR_ROOT_E131_DATA
+    packet[22:38] = cid
+    packet[38:40] = (0x7000 | (length - 38)).to_bytes(2, 'big')
+    packet[40:44] = (2).to_bytes(4, 'big')                 # VECTOR_E131_DATA_PACKET
+    packet[44:108] = source.encode('utf-8')[0:63].ljust(64, b'\x00')
+    packet[108] = priority
+    packet[113:115] = universe.to_bytes(2, 'big')
+    packet[115:117] = (0x7000 | (length - 115)).to_bytes(2, 'big')
+    packet[117] = 2                                         # VECTOR_DMP_SET_PROPERTY
+    packet[118] = 0xa1                                      # address and data type
+    packet[121:123] = (1).to_bytes(2, 'big')                # address increment
+    packet[123:125] = (channels + 1).to_bytes(2, 'big')     # start code and channels
+    return length
+
+def _artnet_header(packet, universe, channels):
+    channels += channels % 2 # length has to be even
+    packet[0:8] = b'Art-Net\x00'
+    packet[8:10] = (0x5000).to_bytes(2, 'little')           # OpDmx
+    packet[10:12] = (14).to_bytes(2, 'big')                 # protocol version
+    packet[14:16] = universe.to_bytes(2, 'little')          # SubUni, Net
+    packet[16:18] = channels.to_bytes(2, 'big')
+    return _ARTNET_HEADER + channels
+
+class NetworkStrip:
+    """
+    led_count LEDs sent to host (E1.31 with host=None: the standard
+    multicast group of each universe), universe numbers counting up from
+    universe (default: the first one, 1 for E1.31 and 0 for Art-Net),
+    pixels_per_universe LEDs in each. order is the order the
+    controller wants the channels in ('RGB', 'GRB', 'RGBW'...). As the
+    strip driver does, the brightness scales every channel and the
+    gamma table (setGamma) is applied after it.
+    """
+    def __init__(self, led_count, host=None, protocol=E131, universe=None, port=None, pixels_per_universe=170,
+            order='RGB', source='led-animator', priority=100):
+        if protocol == ARTNET and host is None:
+            raise ValueError('Art-Net needs a host (or broadcast address) to send to')
+        self._n = led_count
+        self._pixels = numpy.zeros(led_count, numpy.uint32)
+        self._brightness = 255
+        self._gamma = numpy.arange(256, dtype=numpy.uint8)
+        self._lut = None # brightness and gamma in one, rebuilt when either changes
+        self._sock = None
+        self.protocol = protocol
+        port = port or (E131_PORT if protocol == E131 else ARTNET_PORT)
+        if universe is None: # E1.31 universes start at 1, Art-Net port-addresses at 0
+            universe = 1 if protocol == E131 else 0
+
+        # where each channel's byte is in the uint32 pixels
+        byte_of = {'B': 0, 'G': 1, 'R': 2, 'W': 3}
+        byte_of = [byte_of[c] for c in order.upper()]
+        if sys.byteorder == 'big':
+            byte_of = [3 - b for b in byte_of]
+        per_led = len(byte_of)
+        per_universe = min(pixels_per_universe, DMX_CHANNELS // per_led)
+        universes = -(-led_count // per_universe)
+        header = _E131_HEADER if protocol == E131 else _ARTNET_HEADER
+        self._packet_size = size = header + DMX_CHANNELS
+        self._packets = numpy.zeros((universes, size), numpy.uint8)
+        # the pixel channels of every packet, back to back, and where each one comes from
+        channels = per_universe * per_led
+        self._data = self._packets[:, header:header+channels]
+        src = (numpy.arange(universes * per_universe)[:, None] * 4 + byte_of).reshape(universes, channels)
+        self._src = numpy.minimum(src, led_count * 4 - 1) # past the last LED: unused, never sent
+        self._bytes = numpy.zeros((universes, channels), numpy.uint8)
+        self._seq = _E131_SEQ if protocol == E131 else _ARTNET_SEQ
+        self._sequence = 0
+
+        cid = uuid.uuid4().bytes
+        self._sends = [] # (packet to send, address) for each universe
+        out = memoryview(self._packets).cast('B')
+        for i in range(universes):
+            u = universe + i
+            used = min(per_universe, led_count - i * per_universe) * per_led
+            packet = bytearray(size)
+            if protocol == E131:
+                length = _e131_header(packet, cid, source, u, used, priority)
+                address = (host if host is not None else '239.255.{0}.{1}'.format(u >> 8, u & 0xFF), port)
+            else:
+                length = _artnet_header(packet, u, used)
+                address = (host, port)
+            self._packets[i] = numpy.frombuffer(packet, numpy.uint8)
+            self._sends.append((out[i*size:i*size+length], address))
+
+    def begin(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+    def show(self):
+        if self._sock is None:
+            self.begin()
+        if self._lut is None:
+            self._lut = self._gamma[(numpy.arange(256) * (self._brightness+1)) >> 8]
+        numpy.take(self._pixels.view(numpy.uint8), self._src, out=self._bytes, mode='clip')
+        numpy.take(self._lut, self._bytes, out=self._data, mode='clip')
+        self._sequence = self._sequence % 255 + 1 # 0 means 'not sequenced' to Art-Net
+        self._packets[:, self._seq] = self._sequence
+        sendto = self._sock.sendto
+        for packet, address in self._sends:
+            sendto(packet, address)
+
+    def finish(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def universes(self):
+        """How many universes (packets per frame) the strip takes"""
+        return len(self._sends)
+
+    def setBrightness(self, brightness):
+        if brightness != self._brightness:
+            self._brightness = brightness
+            self._lut = None
+
+    def getBrightness(self):
+        return self._brightness
+
+    def setGamma(self, gamma):
+        if len(gamma) == 256:
+            self._gamma = numpy.array(gamma, numpy.uint8)
+            self._lut = None
+
+    def getPixels(self):
+        return self._pixels
+
+    def numPixels(self):
+        return self._n
+
+    def setPixelColor(self, n, colour):
+        self._pixels[n] = colour
+
+    def setPixelColorRGB(self, n, r, g, b, w=0):
+        self._pixels[n] = (w << 24) | (r << 16) | (g << 8) | b
+
+    def getPixelColor(self, n):
+        return int(self._pixels[n])
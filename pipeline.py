@@ -0,0 +1,120 @@
+# Double-buffered output: overlaps composing frame N+1 with sending frame N.
+# PipelinedStrip looks like a PixelStrip to the animator. The animator draws
+# into the back buffer; show() swaps it with the front buffer and hands the
+# front one to an output thread, which copies it into the real strip and
+# calls the real show(). How much actually overlaps depends on the driver
+# letting go of the GIL while it waits for the DMA to finish.
+import threading
+import numpy
+
+class PipelinedStrip:
+    """
+    Wraps a PixelStrip (real, simulated or headless) with a back buffer
+    and an output thread. At most one frame is ever waiting to be sent:
+    show() waits for the previous frame to be taken before swapping.
+    """
+    def __init__(self, strip):
+        self.strip = strip
+        n = strip.numPixels()
+        self._n = n
+        self._back = numpy.zeros(n, numpy.uint32)      # the animator draws in here
+        self._front = numpy.zeros(n, numpy.uint32)     # being sent by the output thread
+        self._front_out = memoryview(self._front)
+        self._brightness = strip.getBrightness()
+        self._front_brightness = self._brightness
+        self._cond = threading.Condition()
+        self._full = False      # front buffer holds a frame not yet (completely) sent
+        self._running = False
+        self._error = None      # exception raised in the output thread, re-raised by show()
+        self._thread = None
+
+    def begin(self):
+        self.strip.begin()
+        self._running = True
+        self._thread = threading.Thread(target=self._output, name='led-output', daemon=True)
+        self._thread.start()
+
+    def _output(self):
+        """Output thread: send each frame handed over by show()"""
+        cond = self._cond
+        while True:
+            with cond:
+                while not self._full and self._running:
+                    cond.wait()
+                if not self._full: # stopped and nothing left to send
+                    return
+            try:
+                self.strip.setBrightness(self._front_brightness)
+                self.strip.getPixels()[0:self._n] = self._front_out
+                self.strip.show()
+            except BaseException as e: # including SystemExit, e.g. the simulator quitting
+                self._error = e
+            finally:
+                with cond:
+                    self._full = False
+                    cond.notify_all()
+
+    def show(self):
+        """Hand the frame in the back buffer to the output thread"""
+        if self._error is not None:
+            error = self._error; self._error = None
+            raise error
+        if self._thread is None: # not started, just send it
+            self.strip.setBrightness(self._brightness)
+            self.strip.getPixels()[0:self._n] = memoryview(self._back)
+            self.strip.show()
+            return
+        with self._cond:
+            while self._full: # previous frame still being sent
+                self._cond.wait()
+            if self._error is not None: # sending it failed
+                error = self._error; self._error = None
+                raise error
+            # swap buffers, the new back buffer starts as a copy of this frame
+            # as the animator may only redraw part of it
+            self._front, self._back = self._back, self._front
+            self._front_out = memoryview(self._front)
+            self._back[:] = self._front
+            self._front_brightness = self._brightness
+            self._full = True
+            self._cond.notify_all()
+
+    def wait(self):
+        """Wait until every frame shown so far has been sent"""
+        with self._cond:
+            while self._full:
+                self._cond.wait()
+
+    def finish(self):
+        """Send anything outstanding and stop the output thread"""
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+        if hasattr(self.strip, 'finish'):
+            self.strip.finish()
+
+    def setBrightness(self, brightness):
+        self._brightness = brightness
+
+    def getBrightness(self):
+        return self._brightness
+
+    def setGamma(self, gamma):
+        if hasattr(self.strip, 'setGamma'):
+            self.wait() # not in the middle of sending a frame
+            self.strip.setGamma(gamma)
+
+    def getPixels(self):
+        return self._back
+
+    def numPixels(self):
+        return self._n
+
+    def setPixelColor(self, n, colour):
+        self._back[n] = colour
+
+    def getPixelColor(self, n):
+        return int(self._back[n])
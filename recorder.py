@@ -0,0 +1,156 @@
+# Recording animations to a file and playing them back.
+# Render a long or heavy show once (offline, e.g. with a VirtualClock, on a
+# fast machine) and a weak controller can play it with almost no CPU:
+#
+#   clock = VirtualClock()
+#   rec = RecordingStrip('show.leds', 300, clock.time)
+#   anim = Animator(300, NUMPY, rec, clock.time, clock.sleep)
+#   ...anim.define_pattern() etc...
+#   anim.render(clock.time() + 600); rec.finish()
+#
+#   Player('show.leds').play(strip)
+#
+# File layout (little endian):
+#   header  HEADER: magic, version, LED count, frames shown, distinct frames,
+#           duration (secs) and where the table starts
+#   pixels  each distinct frame once, LED count uint32 colours per frame
+#   table   one TABLE_DTYPE entry per frame shown: time from the start,
+#           which distinct frame and the brightness
+# Patterns repeat (a moving gradient is back where it started every repeat_s)
+# so storing each distinct frame once is where the saving is. Every stored
+# frame is plain pixels, so the player hands the strip views straight into
+# the memory mapped file rather than decoding anything.
+import struct, mmap, hashlib
+from time import time, sleep
+import numpy
+
+MAGIC = b'LEDANIM\0'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIIIdQ') # magic, version, unused, led count, frames, distinct frames, duration, table offset
+TABLE_DTYPE = numpy.dtype([('t', '<f8'), ('frame', '<u4'), ('brightness', '<u4')])
+
+class RecordingStrip:
+    """
+    Looks like a PixelStrip to the animator and records every frame shown
+    into the file path. If strip is given frames are also passed on to it,
+    so a show can be watched while it is recorded. clock_time should be
+    the clock the animator uses. Call finish() when done to complete the file.
+    """
+    def __init__(self, path, led_count, clock_time=time, strip=None, brightness=255):
+        self._n = led_count
+        self._time = clock_time
+        self.strip = strip
+        self._pixels = numpy.zeros(led_count, numpy.uint32)
+        self._brightness = brightness
+        self._file = open(path, 'wb')
+        self._file.write(bytes(HEADER.size)) # filled in by finish()
+        self._seen = {}         # digest of a distinct frame -> its number in the file
+        self._table = []        # (t, frame, brightness) for every frame shown
+        self._t0 = None
+
+    def begin(self):
+        if self.strip is not None:
+            self.strip.begin()
+
+    def show(self):
+        t = self._time()
+        if self._t0 is None:
+            self._t0 = t
+        data = memoryview(self._pixels)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        frame = self._seen.get(digest)
+        if frame is None:
+            frame = self._seen[digest] = len(self._seen)
+            self._file.write(data)
+        self._table.append((t - self._t0, frame, self._brightness))
+        if self.strip is not None:
+            self.strip.setBrightness(self._brightness)
+            self.strip.getPixels()[0:self._n] = data
+            self.strip.show()
+
+    def finish(self):
+        """Write the frame table and header and close the file"""
+        if self._file.closed:
+            return
+        duration = self._time() - self._t0 if self._t0 is not None else 0.0
+        offset = self._file.tell()
+        pad = -offset % TABLE_DTYPE.alignment
+        self._file.write(bytes(pad))
+        offset += pad
+        self._file.write(numpy.array(self._table, TABLE_DTYPE).tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, self._n, len(self._table), len(self._seen), duration, offset))
+        self._file.close()
+        if self.strip is not None and hasattr(self.strip, 'finish'):
+            self.strip.finish()
+
+    def setBrightness(self, brightness):
+        self._brightness = brightness
+
+    def getBrightness(self):
+        return self._brightness
+
+    def getPixels(self):
+        return self._pixels
+
+    def numPixels(self):
+        return self._n
+
+    def setPixelColor(self, n, colour):
+        self._pixels[n] = colour
+
+    def getPixelColor(self, n):
+        return int(self._pixels[n])
+
+class Player:
+    """
+    Memory maps a file written by RecordingStrip. frames is a (distinct
+    frames, LEDs) uint32 view of the pixels and table the frame table,
+    both straight onto the file, so nothing is read until it is played.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, unused, led_count, n_frames, n_distinct, duration, offset = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError('{0} is not a version {1} recording'.format(path, VERSION))
+        self.led_count = led_count
+        self.duration = duration
+        self.frames = numpy.frombuffer(self._mm, numpy.uint32, n_distinct * led_count, HEADER.size).reshape(n_distinct, led_count)
+        self.table = numpy.frombuffer(self._mm, TABLE_DTYPE, n_frames, offset)
+
+    def __len__(self):
+        return len(self.table)
+
+    def play(self, strip, clock_time=time, clock_sleep=sleep, loop=False):
+        """
+        Show the recording on strip with its original timing. If we fall
+        behind, frames are skipped rather than letting the playback drift.
+        loop=True starts again at the end, for ever.
+        """
+        n = min(self.led_count, strip.numPixels())
+        times = self.table['t']
+        frames = self.table['frame']
+        brightness = self.table['brightness']
+        if len(times) == 0:
+            return
+        while True:
+            t0 = clock_time()
+            i = 0
+            while i < len(times):
+                pause = t0 + times[i] - clock_time()
+                if pause > 0: clock_sleep(pause)
+                strip.setBrightness(int(brightness[i]))
+                strip.getPixels()[0:n] = memoryview(self.frames[frames[i], :n])
+                strip.show()
+                # next frame, skipping any whose time has already passed
+                i = max(i+1, int(numpy.searchsorted(times, clock_time() - t0, 'right')) - 1)
+            if not loop:
+                break
+            pause = t0 + self.duration - clock_time()
+            if pause > 0: clock_sleep(pause)
+
+    def close(self):
+        del self.frames, self.table # views must go before the map can close
+        self._mm.close()
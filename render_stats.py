@@ -0,0 +1,117 @@
+# Low overhead render instrumentation for the animator.
+# Stage durations and frame lateness go into fixed log2 histograms (one
+# bucket per power of two microseconds) so recording a value is a couple
+# of integer operations and memory use never grows, however long the show.
+import json
+from time import perf_counter
+
+# Stages of a frame, in the order Animator.render_frame runs them
+SEGMENT=0; SPOT=1; MIRROR=2; FADE_SPARK=3; SHOW=4
+STAGE_NAMES = ('segment', 'spot', 'mirror', 'fade_spark', 'show')
+N_BUCKETS = 32 # bucket b holds values of 2**(b-1) to 2**b - 1 microseconds
+
+class Histogram:
+    """
+    Log2 histogram of durations in seconds (stored as microseconds)
+    """
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def add(self, secs):
+        us = max(0.0, secs * 1000000)
+        self.buckets[min(N_BUCKETS-1, int(us).bit_length())] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us: self.max_us = us
+
+    def percentile(self, pc):
+        """Upper bound (microseconds) of the bucket holding the pc'th percentile"""
+        if self.count == 0:
+            return 0
+        target = self.count * pc / 100
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(self.max_us, (1 << b) - 1) if b > 0 else 0
+        return self.max_us
+
+    def summary(self):
+        return {'count': self.count,
+            'mean_us': self.total_us / self.count if self.count else 0,
+            'p50_us': self.percentile(50), 'p99_us': self.percentile(99),
+            'max_us': self.max_us, 'buckets': list(self.buckets)}
+
+class RenderStats:
+    """
+    Collects per-stage timings, deadline misses, skipped pattern steps and
+    the achieved frame rate. The animator calls stage() after each stage of
+    a frame and frame_done() at the end; query with summary().
+    late_s is how late a frame can start before it counts as a miss.
+    """
+    def __init__(self, late_s=0.002):
+        self.late_s = late_s
+        self.stages = [Histogram() for name in STAGE_NAMES]
+        self.frame = Histogram()        # whole frame compute + show
+        self.lateness = Histogram()     # how late each frame started
+        self.frames = 0
+        self.misses = 0
+        self.skipped_steps = 0
+        self.unchanged = 0              # frames not sent because nothing changed
+        self._due = None                # when the next frame should start
+        self._last_step = None
+        self._t_first = None
+        self._t_last = None
+
+    def stage(self, stage, t0):
+        """Record the stage that started at perf_counter() t0, return the time now"""
+        t1 = perf_counter()
+        self.stages[stage].add(t1 - t0)
+        return t1
+
+    def pattern_step(self, step):
+        """Note the pattern step rendered, counting any that were skipped"""
+        if self._last_step is not None and step > self._last_step + 1:
+            self.skipped_steps += step - self._last_step - 1
+        self._last_step = step
+
+    def frame_start(self, t_now):
+        """Called at the start of a frame with the animation time"""
+        if self._due is not None:
+            late = t_now - self._due
+            self.lateness.add(max(0, late))
+            if late > self.late_s:
+                self.misses += 1
+        if self._t_first is None:
+            self._t_first = t_now
+        self._t_last = t_now
+
+    def frame_done(self, t_start, t_next):
+        """Called at the end of a frame that began at perf_counter() t_start"""
+        self.frame.add(perf_counter() - t_start)
+        self.frames += 1
+        self._due = t_next
+
+    def frame_unchanged(self):
+        """Called for a frame that wasn't sent to the strip"""
+        self.unchanged += 1
+
+    def fps(self):
+        """Frames per second achieved between the first and last frame"""
+        if self.frames < 2 or self._t_last == self._t_first:
+            return 0.0
+        return (self.frames - 1) / (self._t_last - self._t_first)
+
+    def summary(self):
+        return {'frames': self.frames, 'fps': self.fps(),
+            'deadline_misses': self.misses, 'skipped_steps': self.skipped_steps, 'unchanged_frames': self.unchanged,
+            'frame': self.frame.summary(), 'lateness': self.lateness.summary(),
+            'stages': {name: h.summary() for name, h in zip(STAGE_NAMES, self.stages)}}
+
+    def dump(self, path):
+        """Write summary() to path as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
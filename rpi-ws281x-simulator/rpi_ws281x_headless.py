@@ -0,0 +1,152 @@
+# Headless drop-in replacement for the neopixel library. Nothing is drawn:
+# each frame passed to show() is recorded into a preallocated ring buffer
+# and/or streamed to a file, so the animator can be tested and profiled on
+# a machine with no display (and no cv2).
+# With a VirtualClock, sleeping just moves the clock on, so a long show
+# renders as fast as the CPU allows.
+import math
+import numpy
+from time import time
+
+def Color(r, g, b, w=0):
+    return ((r & 0xFF)<<16) | ((g & 0xFF)<<8) | (b & 0xFF)
+
+RING_FRAMES = 256 # how many of the most recent frames are kept by default
+
+class VirtualClock:
+    """
+    Stand-in for time.time and time.sleep. sleep() doesn't wait, it just
+    advances the clock. Hand clock.time and clock.sleep to
+    animator.anim_set_clock (and the clock to PixelStrip for timestamps).
+    """
+    def __init__(self, start=1.0):
+        self.now = start # not 0, the animator uses 0 for 'not started yet'
+
+    def time(self):
+        return self.now
+
+    def sleep(self, secs):
+        if secs > 0:
+            # always move on, even when secs is lost in rounding, otherwise
+            # a loop sleeping until a deadline could spin for ever
+            self.now = max(self.now + secs, math.nextafter(self.now, math.inf))
+
+LED_BIT_S = 1.0/800000 # time to clock one bit out at 800kHz
+LED_RESET_S = 50e-6 # latch time at the end of each frame
+
+class PixelStrip:
+    def __init__(self, led_count, led_pin=18, led_freq_hz=800000, led_dma=10, led_invert=False,
+            led_brightness=255, led_channel=0, strip_type=None, gamma=None,
+            ring_frames=RING_FRAMES, stream=None, clock=None):
+        """
+        Same arguments as the real PixelStrip (gamma is only used by
+        output(), the frames recorded are what the animator sent), plus:
+        ring_frames - how many recent frames to keep in memory (0 = none)
+        stream - binary file object, every frame is written to it as
+                 led_count+1 native uint32s: the brightness then the LEDs
+        clock - a VirtualClock to timestamp frames with instead of time().
+                Each show() moves it on by the time a real strip would
+                take to transmit the frame.
+        """
+        self.N_LEDS = led_count
+        self._led_data = numpy.zeros(led_count, numpy.uint32)
+        self.brightness = led_brightness
+        self._gamma = numpy.arange(256, dtype=numpy.uint8)
+        if gamma is not None:
+            self.setGamma(gamma)
+        self.clock = clock
+        self.stream = stream
+        self.frame_count = 0 # total number of show() calls
+        self.transmit_s = led_count * 24 * LED_BIT_S + LED_RESET_S
+        # Ring buffer: frame data, brightness and timestamp of each frame
+        self._ring = numpy.zeros((ring_frames, led_count), numpy.uint32)
+        self._ring_b = numpy.zeros(ring_frames, numpy.uint8)
+        self._ring_t = numpy.zeros(ring_frames, numpy.float64)
+        # Record written to the stream: brightness followed by the frame
+        self._record = numpy.zeros(led_count+1, numpy.uint32)
+        
+    def begin(self):
+        self.show()
+
+    def setPixelColor(self, ix, colour):
+        self._led_data[ix] = colour
+
+    def show(self):
+        n_ring = len(self._ring)
+        if n_ring > 0:
+            ix = self.frame_count % n_ring
+            self._ring[ix] = self._led_data
+            self._ring_b[ix] = self.brightness
+            self._ring_t[ix] = self.clock.time() if self.clock is not None else time()
+        if self.stream is not None:
+            self._record[0] = self.brightness
+            self._record[1:] = self._led_data
+            self.stream.write(memoryview(self._record))
+        self.frame_count += 1
+        if self.clock is not None:
+            self.clock.sleep(self.transmit_s)
+
+    def _order(self):
+        """Indexes of the frames held in the ring, oldest first"""
+        n_ring = len(self._ring)
+        held = min(self.frame_count, n_ring)
+        return (numpy.arange(self.frame_count - held, self.frame_count)) % max(1, n_ring)
+
+    def frames(self):
+        """The frames held in the ring buffer, oldest first, one per row"""
+        return self._ring[self._order()]
+
+    def frame_brightness(self):
+        """Brightness of each frame returned by frames()"""
+        return self._ring_b[self._order()]
+
+    def frame_times(self):
+        """Time each frame returned by frames() was shown"""
+        return self._ring_t[self._order()]
+
+    def output(self, frames=None, brightness=None):
+        """
+        What the LEDs would actually light up as for frames (default: all
+        those held), given their brightness: scaled by the brightness and
+        then gamma corrected, the same way the real driver does it.
+        """
+        if frames is None:
+            frames, brightness = self.frames(), self.frame_brightness()
+        frames = numpy.asarray(frames, numpy.uint32)
+        b = numpy.asarray(self.brightness if brightness is None else brightness, numpy.uint32)
+        scale = (b + 1).reshape(b.shape + (1,) * (frames.ndim - b.ndim + 1))
+        channels = frames[..., None].view(numpy.uint8) # bytes of each LED, lowest first
+        lit = self._gamma[(channels.astype(numpy.uint32) * scale) >> 8]
+        return lit.view(numpy.uint32)[..., 0]
+
+    def setGamma(self, gamma):
+        if len(gamma) == 256:
+            self._gamma = numpy.array(gamma, numpy.uint8)
+
+    def last_frame(self):
+        """The most recently shown frame (a view into the ring buffer)"""
+        if len(self._ring) == 0:
+            return self._led_data
+        return self._ring[(self.frame_count - 1) % len(self._ring)]
+            
+    def setPixelColorRGB(self, ix, r, g, b, w = 0):
+        self.setPixelColor(ix, Color(r, g, b, w))
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+
+    def getBrightness(self):
+        return self.brightness
+
+    def getPixels(self):
+        return self._led_data
+
+    def numPixels(self):
+        return self.N_LEDS
+
+    def getPixelColor(self, n):
+        return int(self._led_data[n])
+
+    def finish(self):
+        if self.stream is not None:
+            self.stream.flush()
@@ -1,84 +1,135 @@
 # This is a drop-in replacement for the real neopixel library to give a quick
 # simulation of an LED strip on a computer screen
+# The picture is worked out once: an index map holding, for every pixel of the
+# image, which LED it shows (or a spare black entry for the background). Each
+# frame the LED colours are scaled by the brightness and gamma corrected with
+# one 256 entry table, then gathered into the image through the map in one go.
 import numpy
 import cv2
-#import time
+from time import time
 import sys
 
-def _adjust_primary(primary, brightness):
-    return (primary*brightness+128)/255
-    
-def _adjust_colour(colour, brightness):
-    return (_adjust_primary(colour & 0xFF, brightness),
-    _adjust_primary((colour>>8) & 0xFF, brightness),
-    _adjust_primary(colour>>16, brightness))
-
 def Color(r, g, b, w=0):
     return ((r & 0xFF)<<16) | ((g & 0xFF)<<8) | (b & 0xFF)
 
 LED_R = 2 # drawn radius of an LED
-IMAGE_W = 75*2*LED_R # how wide you want the image of the LED strip (pixels)
 #  Define lyout of LED strips. Top left of window is 0,0
 # Each entry has: number of LEDs, x, y co-ord, x, y multiplier
-STRIPS_DEF = ((2, 50,0, 1,0), (150, 152,0, 0,1), (150, 151,151, -1,0), (150, 0,150, 0,-1)) 
-XMIN=-10; XMAX=160
-YMIN=-10; YMAX=160
+STRIPS_DEF = ((2, 50,0, 1,0), (150, 152,0, 0,1), (150, 151,151, -1,0), (150, 0,150, 0,-1))
+MARGIN = 10 # space round the LEDs (in LED positions)
+
+def layout_positions(layout, led_count):
+    """
+    x and y (in LED positions) of each of the first led_count LEDs of a
+    layout like STRIPS_DEF, or of a layout.Layout. LEDs beyond the end of
+    the layout carry on in a line from the last one.
+    """
+    if hasattr(layout, 'x'): # a Layout, drawn on the nearest LED positions
+        x = numpy.rint(layout.x).astype(int); y = numpy.rint(layout.y).astype(int)
+    else:
+        xs = []; ys = []
+        for count, x0, y0, xm, ym in layout:
+            i = numpy.arange(count)
+            xs.append(x0 + xm*i); ys.append(y0 + ym*i)
+        x = numpy.concatenate(xs) if xs else numpy.zeros(0, int)
+        y = numpy.concatenate(ys) if ys else numpy.zeros(0, int)
+    if len(x) < led_count:
+        extra = numpy.arange(1, led_count - len(x) + 1)
+        x = numpy.concatenate((x, (x[-1] if len(x) else 0) + extra))
+        y = numpy.concatenate((y, numpy.full(len(extra), y[-1] if len(y) else 0)))
+    return x[0:led_count], y[0:led_count]
+
+def index_map(x, y, led_r, margin=MARGIN):
+    """
+    Image (rows, columns) of the LED index drawn at each pixel: a filled
+    circle of radius led_r for each LED at (x, y), len(x) where there's
+    no LED. Later LEDs are drawn over earlier ones, as cv2.circle would.
+    """
+    led_w = led_r*2
+    n = len(x)
+    x0 = x.min() - margin if n else 0; y0 = y.min() - margin if n else 0
+    width = ((x.max() - x0 + margin + 1) if n else 1) * led_w
+    height = ((y.max() - y0 + margin + 1) if n else 1) * led_w
+    leds = numpy.full((height, width), n, numpy.intp)
+    dy, dx = numpy.mgrid[-led_r:led_r+1, -led_r:led_r+1]
+    disk = dx*dx + dy*dy <= led_r*led_r
+    dx = dx[disk]; dy = dy[disk]
+    cx = (x - x0)*led_w + led_r; cy = (y - y0)*led_w + led_r
+    px = (cx[:, None] + dx).ravel(); py = (cy[:, None] + dy).ravel()
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    leds[py[inside], px[inside]] = numpy.repeat(numpy.arange(n), len(dx))[inside]
+    return leds
 
 class PixelStrip:
-    def __init__(self, led_count, led_pin, led_freq_hz, led_dma, led_invert, led_brightness, led_channel):
+    def __init__(self, led_count, led_pin, led_freq_hz, led_dma, led_invert, led_brightness, led_channel,
+            strip_type=None, gamma=None, layout=STRIPS_DEF, led_r=LED_R, decimate=1, max_fps=0):
+        """
+        Same arguments as the real PixelStrip, plus:
+        layout - where the LEDs are, see STRIPS_DEF (or a layout.Layout)
+        led_r - radius each LED is drawn with (pixels)
+        decimate - only draw every decimate'th frame
+        max_fps - and no more than this many a second (0 = no limit), so
+                  the preview keeps up with the animation
+        """
         self.N_LEDS = led_count
-        self._led_data = [0 for i in range(led_count)]
+        self._led_data = numpy.zeros(led_count, numpy.uint32)
         self.brightness = led_brightness
-        self.LED_W = LED_R*2
-        self.LEDS_PER_ROW = IMAGE_W // self.LED_W
-        self.N_ROWS = self.N_LEDS // self.LEDS_PER_ROW + 1
-        # Create a black image in which to draw the LEDs
-        self.IMAGE=numpy.zeros(((XMAX-XMIN)*self.LED_W, (YMAX-YMIN)*self.LED_W, 3), numpy.uint8)
-            
-        # ~ print('DEBUG:sim:31 n_rows=',self.N_ROWS,'per_row=',self.LEDS_PER_ROW)
-        # ~ self.IMAGE = numpy.zeros((self.LED_W * self.N_ROWS * 2, IMAGE_W, 3), numpy.uint8)
+        self.gamma = numpy.arange(256, dtype=numpy.uint8)
+        if gamma is not None:
+            self.setGamma(gamma)
+        self._lut = None # brightness and gamma in one, rebuilt when either changes
+        self.decimate = max(1, decimate)
+        self.min_interval = 1.0/max_fps if max_fps > 0 else 0
+        self._shown = 0
+        self._t_drawn = 0
+        self._map = index_map(*layout_positions(layout, led_count), led_r)
+        self._bgr = numpy.zeros((led_count+1, 3), numpy.uint8) # colour of each LED, then the background
+        self.IMAGE = numpy.zeros(self._map.shape + (3,), numpy.uint8)
         cv2.namedWindow('neopixel') # Create a named window
         cv2.moveWindow('neopixel', 10,20) # Move it to a good place on the screen
-        
+
     def begin(self):
         self.show()
 
     def setPixelColor(self, ix, colour):
         self._led_data[ix] = colour
 
-    def numPixels(self):
-        return self.N_LEDS
-
     def show(self):
-        #print(self._led_data)
-        if len(self._led_data) != self.N_LEDS:
-            print('ERROR length of leds has changed to', len(self._led_data))
-        led_ix = 0
-        for s in STRIPS_DEF:
-            x0=s[1]-XMIN; y0=s[2]-YMIN
-            xm=s[3]; ym=s[4]
-            for i in range(s[0]):
-                ix = led_ix + i
-                if ix >= self.N_LEDS: break
-                x = x0 + xm*i
-                y = y0 + ym*i
-                # ~ print('x,y',x,y)
-                adjusted_colour = _adjust_colour(self._led_data[ix], self.brightness)
-                cv2.circle(self.IMAGE, 
-                (self.LED_W*(x) + LED_R, self.LED_W*(y) + LED_R), 
-                LED_R, adjusted_colour, -1)
-            led_ix = ix
+        self._shown += 1
+        if self._shown % self.decimate != 0:
+            return
+        if self.min_interval > 0:
+            t = time()
+            if t - self._t_drawn < self.min_interval:
+                return
+            self._t_drawn = t
+        if self._lut is None: # scale by the brightness then gamma correct, as the real driver does
+            self._lut = self.gamma[(numpy.arange(256) * (self.brightness+1)) >> 8]
+        data = self._led_data
+        lut = self._lut
+        bgr = self._bgr
+        bgr[0:self.N_LEDS, 0] = lut[data & 0xFF]
+        bgr[0:self.N_LEDS, 1] = lut[(data >> 8) & 0xFF]
+        bgr[0:self.N_LEDS, 2] = lut[(data >> 16) & 0xFF]
+        numpy.take(bgr, self._map, axis=0, out=self.IMAGE)
         cv2.imshow('neopixel', self.IMAGE)
         key = cv2.waitKeyEx(1)
         if key != -1: # seem to need about 40ms before anything appears on the screen
             print('*** Interrupted by keyboard *** character code=', key)
             sys.exit(99)
-            
+
     def setPixelColorRGB(self, ix, r, g, b, w = 0):
         self.setPixelColor(ix, Color(r, g, b, w))
 
     def setBrightness(self, brightness):
-        self.brightness = brightness
+        if brightness != self.brightness:
+            self.brightness = brightness
+            self._lut = None
+
+    def setGamma(self, gamma):
+        if len(gamma) == 256:
+            self.gamma = numpy.array(gamma, numpy.uint8)
+            self._lut = None
 
     def getBrightness(self):
         return self.brightness
@@ -90,18 +141,7 @@ class PixelStrip:
         return self.N_LEDS
 
     def getPixelColor(self, n):
-        return self._led_data[n]
+        return int(self._led_data[n])
 
     def finish(self):
         cv2.destroyAllWindows()
-
-# ~ test = Adafruit_NeoPixel(100, 1, 1, 1, 1, 255, 1)
-# ~ test_data = test.getPixels()
-# ~ test_data[:]=[Color(255,255,0)]*100
-# ~ f=1
-# ~ while True:
-    # ~ print(f)
-    # ~ f+=1
-    # ~ test.show()
-    # ~ time.sleep(1)
-# ~ print(_adjust_colour(0xff00f0,254))
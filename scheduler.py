@@ -0,0 +1,76 @@
+# Run several animations (normally one Animator per strip) from one thread.
+# Each Animator's render_frame returns the time its next frame is due. The
+# scheduler keeps those deadlines in a heap, sleeps until the earliest one
+# and renders just that strip, so eight strips cost one sleeping thread
+# rather than eight processes each busy with its own render loop.
+# Deadlines are the absolute times worked out by the animators, so lateness
+# in one frame doesn't push the following frames back (no drift).
+import heapq
+from time import time, sleep
+
+class Scheduler:
+    """
+    Shares one render loop between any number of Animators.
+    clock_time and clock_sleep should be the same clock the animators use
+    (e.g. a VirtualClock's time and sleep).
+    """
+    def __init__(self, clock_time=time, clock_sleep=sleep):
+        self._time = clock_time
+        self._sleep = clock_sleep
+        self._heap = []         # [t_due, sequence, anim, min_interval] (sequence breaks ties)
+        self._entries = {}      # anim -> its heap entry, so it can be removed
+        self._seq = 0
+
+    def add(self, anim, max_fps=0):
+        """
+        Start rendering anim, no more often than max_fps frames a second
+        (0 = as often as the animation asks for)
+        """
+        self.remove(anim)
+        entry = [self._time(), self._seq, anim, 1.0 / max_fps if max_fps > 0 else 0]
+        self._seq += 1
+        self._entries[anim] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, anim):
+        """Stop rendering anim (it stays on the heap but is skipped)"""
+        entry = self._entries.pop(anim, None)
+        if entry is not None:
+            entry[2] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def run_once(self, stop_time=0):
+        """
+        Wait for the next deadline (but not beyond stop_time, if given) and
+        render that strip. Returns False if there was nothing to do.
+        """
+        heap = self._heap
+        while heap and heap[0][2] is None: # drop removed animations
+            heapq.heappop(heap)
+        if not heap:
+            return False
+        entry = heap[0]
+        pause = entry[0] - self._time()
+        if stop_time != 0:
+            pause = min(pause, stop_time - self._time())
+        if pause > 0:
+            self._sleep(pause)
+            if entry[0] > self._time(): # woken early by stop_time
+                return True
+        t_now = self._time()
+        t_next = entry[2].render_frame()
+        if entry[3] > 0: # frame rate cap
+            t_next = max(t_next, t_now + entry[3])
+        entry[0] = t_next
+        heapq.heapreplace(heap, entry)
+        return True
+
+    def run(self, stop_time=0):
+        """
+        Keep rendering all the animations until stop_time (or for ever if 0)
+        """
+        while stop_time == 0 or self._time() < stop_time:
+            if not self.run_once(stop_time):
+                break
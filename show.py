@@ -0,0 +1,134 @@
+# Shows: a timeline of animator settings ("cues") played one after another.
+# Each cue is rendered ahead of time by a worker process into a shared
+# memory frame buffer, so on a multi-core Pi the heavy composing (many
+# segments, smooth gradients, sparkle) happens on the other cores and the
+# main process only copies finished frames to the strip.
+#
+# A cue is a dict, e.g.
+#   {'secs': 20, 'brightness': 200,
+#    'pattern': {'g_desc': gradient_preset(5, SMOOTH), 'segments': 4, 'motion': L2R1},
+#    'spot': {'s_size': 3, 's_colour': RGB_Green},
+#    'sparkle': {'s_per_k': 10}, 'fade': {'f_secs': 5, 'f_min': 50}}
+# The pattern, spot, sparkle and fade entries are the keyword arguments of
+# the matching anim_define_* function; all but 'secs' and 'pattern' are optional.
+import sys, os
+from time import time, sleep
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy
+sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/rpi-ws281x-simulator')
+import animator
+from rpi_ws281x_headless import PixelStrip as HeadlessStrip, VirtualClock
+
+def _cue_frames(cue, fps):
+    return max(1, int(round(cue['secs'] * fps)))
+
+def _apply_cue(anim, cue):
+    """Set an Animator up as described by cue"""
+    anim.set_max_brightness(cue.get('brightness', 255))
+    anim.define_pattern(**cue['pattern'])
+    if 'spot' in cue: anim.define_spot(**cue['spot'])
+    if 'sparkle' in cue: anim.define_sparkle(**cue['sparkle'])
+    if 'fade' in cue: anim.define_fade(**cue['fade'])
+
+def _render_cue(led_count, cue, fps, engine, shm_name):
+    """
+    Worker process: render every frame of cue at fps into the shared
+    memory block shm_name, one row per frame: brightness then the LEDs
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = numpy.ndarray((_cue_frames(cue, fps), led_count+1), numpy.uint32, shm.buf)
+        clock = VirtualClock()
+        strip = HeadlessStrip(led_count, ring_frames=0)
+        anim = animator.Animator(led_count, engine, strip, clock.time, clock.sleep)
+        _apply_cue(anim, cue)
+        t0 = clock.now
+        for i in range(len(frames)):
+            clock.now = t0 + i / fps
+            anim.render_frame()
+            frames[i, 0] = strip.getBrightness()
+            frames[i, 1:] = strip.getPixels()
+        del frames # release the view before closing
+    finally:
+        shm.close()
+
+class Show:
+    """
+    Plays a timeline of cues on a strip, with the next few cues being
+    rendered in a pool of worker processes while the current one plays.
+    """
+    def __init__(self, led_count, timeline, fps=50, workers=None, engine=animator.NUMPY, strip=None):
+        """
+        timeline is a list of cues (see above), fps the fixed frame rate
+        cues are rendered and played at, workers the number of worker
+        processes (default: one per CPU) and strip the PixelStrip to play
+        on (default: one made from animator's LED_* settings).
+        """
+        self.led_count = led_count
+        self.timeline = list(timeline)
+        self.fps = fps
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        if strip is None:
+            strip = animator.PixelStrip(led_count, animator.LED_PIN, animator.LED_FREQ_HZ,
+            animator.LED_DMA, animator.LED_INVERT, 0, animator.LED_CHANNEL)
+            strip.begin()
+        self.strip = strip
+
+    def _submit(self, pool, cue):
+        """Start rendering cue, return (shared memory, future)"""
+        size = _cue_frames(cue, self.fps) * (self.led_count+1) * 4
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            future = pool.submit(_render_cue, self.led_count, cue, self.fps, self.engine, shm.name)
+        except BaseException:
+            shm.close(); shm.unlink()
+            raise
+        return shm, future
+
+    def play(self, clock_time=time, clock_sleep=sleep):
+        """
+        Play the whole timeline. Frames are shown at fixed times from the
+        start of each cue; if we fall behind, frames are dropped rather
+        than letting the show drift.
+        Each cue is held completely in memory while it is rendered and
+        played: secs * fps * (LEDs+1) * 4 bytes, for up to workers cues
+        at a time (e.g. 60s at 50fps on 300 LEDs is 3.6MB per cue).
+        """
+        strip = self.strip
+        n = self.led_count
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        ahead = []
+        frames = None
+        try:
+            for cue in self.timeline[:self.workers]:
+                ahead.append(self._submit(pool, cue))
+            for ix, cue in enumerate(self.timeline):
+                shm, future = ahead[0]
+                if ix + self.workers < len(self.timeline): # keep the pool busy
+                    ahead.append(self._submit(pool, self.timeline[ix + self.workers]))
+                future.result() # wait for it to be rendered (and see any exception)
+                frames = numpy.ndarray((_cue_frames(cue, self.fps), n+1), numpy.uint32, shm.buf)
+                t0 = clock_time()
+                i = 0
+                while i < len(frames):
+                    strip.setBrightness(int(frames[i, 0]))
+                    strip.getPixels()[0:n] = memoryview(frames[i, 1:])
+                    strip.show()
+                    pause = t0 + (i+1) / self.fps - clock_time()
+                    if pause > 0: clock_sleep(pause)
+                    # next frame, skipping any we're already too late for
+                    i = max(i+1, int((clock_time() - t0) * self.fps))
+                frames = None # release the view before closing
+                ahead.pop(0)
+                shm.close(); shm.unlink()
+        finally:
+            # only anything left if something went wrong (or Ctrl-C): don't
+            # wait for the cues still being rendered, just throw them away
+            frames = None
+            for shm, future in ahead:
+                future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            for shm, future in ahead:
+                shm.close(); shm.unlink()